@@ -1,16 +1,26 @@
 import argparse
-import ast
 import re
-from MySQL import MySQL
+from MySQL import MySQL, BATCH_SIZE, POOL_SIZE
+from Snapshot import Snapshot
+from StageGraph import Stage, StageGraph
+from Partitions import partitionDir, fileEntry, readManifest, writeManifest, removeStale, updateIndex
+from Models.TagTable import decodeValues
+from Models.RaterMatrix import RaterMatrix
+from SQLiteDataSource import SQLiteDataSource
 from collections import defaultdict
 from TaggerClassifier import TaggerClassifier
 from TagClassifier import TagClassifier
-from PatternDetection_refactored import PatternDetection
+from PatternDetection_refactored import PatternDetection, detectPatterns
 import numpy as np
 import pandas as pd
 import os
 import csv
-import ast
+import pickle
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from itertools import repeat
+
+WRITERS = 4     # number of output files written concurrently by every shard
 
 class Application: 
     """
@@ -18,21 +28,128 @@ class Application:
     and performing quality control tasks such as speed-based tagging analysis, 
     inter-rater reliability (Krippendorff's alpha), tag credibility assessment, and pattern detection.
     """
-    def __init__(self) -> None:
-        self._connector = MySQL()                       # MySQL connector to call methods of MySQL class
-        self.assignment_to_users = defaultdict(dict)    # dictionary to store the result of interval logs query
+    def __init__(self, assignment_ids=(1166,), output_dir="data", batch_size=BATCH_SIZE, pool_size=POOL_SIZE, export_answers=False,
+                 cache_dir="data/cache", refresh=False, incremental=False, database=None, workers=1, write_intermediate=True,
+                 output_format="csv") -> None:
+        self.assignment_ids = tuple(assignment_ids)     # assignments processed by this application
+        self.output_dir = output_dir                    # directory every output file of this run is written to
+        # Data source to call methods of the DataSource interface, the live MySQL database unless an offline SQLite file is given
+        self._connector = MySQL(self.assignment_ids, pool_size) if database is None else SQLiteDataSource(database, self.assignment_ids, pool_size)
+        self.batch_size = batch_size                    # number of rows streamed from the database per batch
+        self.export_answers = export_answers            # whether the answers of the teams are exported to answers.csv
+        self.cache_dir = cache_dir                      # directory of the on-disk snapshot cache
+        self.refresh = refresh                          # whether the cached snapshot and stage outputs are ignored and computed again
+        self.incremental = incremental                  # whether only users and teams touched by new tags are recomputed
+        self.workers = workers                          # number of processes the per-user pattern detection is spread over
+        self.write_intermediate = write_intermediate    # whether the table of every stage is written along with the final results
+        self.output_format = output_format              # "csv" for human-readable files, "parquet" for typed columns with native lists, or "both"
+        self.outputs = {}                               # {file name: (writer, table, options)}, written at the end of the run
+        self.snapshot = None                            # tags and side tables of the assignments, loaded by assignTaggerReliability
+        self.parameters = {}                            # parameters of the run, recorded in the manifest of the output directory
+        self.assignment_to_users = defaultdict(dict)    # tags table of every user, as {assignment_id: {user_id: TagTable}}
         self.tagger_classifier = TaggerClassifier()     # object of TaggerClassifier class
         self.tag_classifier = TagClassifier()           # object of TagClassifier class
         self.interval_logs_result = defaultdict(dict)   # result of interval logs
+        self.interval_logs_df = pd.DataFrame()          # interval logs of the users above the log time threshold
         self.krippendorff_result = defaultdict(dict)    # result of krippendorff alpha for a user
-        self.agree_disagree_tags = defaultdict(dict)    # result of agreement/disagreement for each tag
+        self.krippendorff_df = pd.DataFrame()           # krippendorff alpha of the users above the alpha threshold
+        self.agree_disagree_tags = pd.DataFrame()       # result of agreement/disagreement for each (answer, tag prompt) of each team
         self.pattern_detection_result = defaultdict(dict) # result of interval logs
-        self.assignment_to_user = defaultdict(dict)   
-        self.user_history_dict = defaultdict(dict)
+        self.pattern_results_df = pd.DataFrame()        # patterns found for every user, one row per pattern
+        self.longest_y_n_df = pd.DataFrame()            # long runs of Ys and Ns of every user
+        self.user_data_df = pd.DataFrame()              # tags of the user history with their credibility score
         self.pattern_detection = PatternDetection()
-        self.assignment_to_teams = {}                  # dictionary that stores the result of getUserTeams function
+        os.makedirs(self.output_dir, exist_ok=True)
+
+    def _outputPath(self, file_name) -> str:
+        """
+        Returns the path of an output file inside the output directory of this run
+        """
+        return os.path.join(self.output_dir, file_name)
+
+    def _addOutput(self, file_name, df, writer=None, **options) -> None:
+        """
+        Registers a table to be written to a file of the output directory at the end of the run, as CSV unless another writer is given
+        """
+        self.outputs[file_name] = (writer or _writeCsv, df, options)
+
+    def writeOutputs(self, final_files=()) -> None:
+        """
+        Writes the registered outputs to the output directory, the tables of the stages only if write_intermediate is set.
+        Tables are written in their CSV or text view, and/or as Parquet files keeping the typed columns and lists as they are.
+        The files are written concurrently, then the manifest of the directory lists them with their row counts and
+        checksums along with the parameters of the run. Files listed by the previous manifest and not written again are deleted.
+
+        Args:
+            final_files (iterable): Outputs that are always written.
+        """
+        writes = []
+        for file_name, (writer, df, options) in self.outputs.items():
+            if not (self.write_intermediate or file_name in final_files):
+                continue
+            if self.output_format in ("csv", "both"):
+                writes.append((file_name, df, lambda df, path, writer=writer, options=options: writer(df, path, **options)))
+            if self.output_format in ("parquet", "both"):
+                writes.append((_parquetName(file_name), df, lambda df, path: df.to_parquet(path, index=False)))
+
+        def write(file_name, df, writer):
+            writer(df, self._outputPath(file_name))
+            return fileEntry(self._outputPath(file_name), len(df))
+
+        with ThreadPoolExecutor(max_workers=WRITERS) as executor:
+            files = list(executor.map(write, *zip(*writes))) if writes else []
+        for entry in files:
+            print(f"{entry['file']} written to {self._outputPath(entry['file'])}")
+        previous = readManifest(self.output_dir)
+        writeManifest(self.output_dir, {"assignment_ids": list(self.assignment_ids), "parameters": self.parameters, "files": files})
+        for file_name in removeStale(self.output_dir, previous, files):
+            print(f"{file_name} of an earlier run removed from {self.output_dir}")
+
+    def _statePath(self) -> str:
+        """
+        Returns the path of the per-user and per-team results persisted for incremental runs
+        """
+        return os.path.join(self.cache_dir, "results_" + "-".join(str(assignment_id) for assignment_id in self.assignment_ids) + ".pkl")
+
+    def _loadState(self, pattern_params):
+        """
+        Restores the per-user and per-team results of the previous run, if they were computed on the
+        cached snapshot the current snapshot was brought up to date from.
+
+        Args:
+            pattern_params (dict): pattern detection parameters of this run
+
+        Returns:
+            tuple: (assignment_id, user_id) pairs to recompute for interval logs and Krippendorff alpha,
+                   and the pairs to recompute for pattern detection. None means every user.
+        """
+        if self.snapshot.changed_users is None or not os.path.exists(self._statePath()):
+            return None, None
+        with open(self._statePath(), "rb") as f:
+            state = pickle.load(f)
+        if state["watermark"] != self.snapshot.base_watermark:
+            return None, None
+
+        self.interval_logs_result = defaultdict(dict, state["interval_logs"])
+        self.krippendorff_result = defaultdict(dict, state["krippendorff"])
+        if state["pattern_params"] != pattern_params:
+            # Pattern results depend on the pattern parameters, they are recomputed for everyone when those change
+            return self.snapshot.changed_users, None
+        self.pattern_detection_result = defaultdict(dict, state["patterns"])
+        return self.snapshot.changed_users, self.snapshot.changed_users
+
+    def _saveState(self, pattern_params) -> None:
+        """
+        Persists the per-user and per-team results of this run along with the watermark they are current to
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        state = {"watermark": self.snapshot.watermark, "pattern_params": pattern_params, "interval_logs": dict(self.interval_logs_result),
+                 "krippendorff": dict(self.krippendorff_result), "patterns": dict(self.pattern_detection_result)}
+        with open(self._statePath() + ".tmp", "wb") as f:
+            pickle.dump(state, f)
+        os.replace(self._statePath() + ".tmp", self._statePath())
         
-    def __getIntervalLogs(self, tags, log_time=None) -> None:
+    def __getIntervalLogs(self, tags, log_time=None, users=None) -> None:
         """
          Calculates interval log values for each user, which are used to evaluate how quickly users assigned tags.
         Helps identify users who might have tagged "too fast," indicating potentially unreliable data.
@@ -46,7 +163,7 @@ class Application:
         - **Credibility Implication**:
           Users with a very low average log interval time might have tagged too quickly, suggesting poor quality.
 
-        Writes results to a CSV:
+        Keeps the results as a table, written to `Interval_logs.csv`:
         - `Assignment_id`: Assignment to which the user belongs.
         - `User_id`: User who assigned the tags.
         - `IL_result`: Average log of interval times.
@@ -54,83 +171,69 @@ class Application:
         - `Number_of_Tags`: Total number of tags assigned by the user.
 
         Args:
-            tags (list): List of tags fetched from the database (list of `AnswerTag` objects).
+            tags (TagTable): Tags of the assignments.
             log_time (float, optional): Minimum acceptable log time; users with lower values are excluded.  
+            users (set, optional): (assignment_id, user_id) pairs to recompute, the results of other users are kept. Defaults to all users.
 
         """
-        # Populating the assignment_to_users hashmap based on the assignment_id and user_id
-        for tag in tags:
-            if tag.assignment_id in self.assignment_to_users:
-                if tag.user_id in self.assignment_to_users[tag.assignment_id]:
-                    self.assignment_to_users[tag.assignment_id][tag.user_id].append(tag)
-                else:
-                    self.assignment_to_users[tag.assignment_id][tag.user_id] = [tag]
-            else:
-                self.assignment_to_users[tag.assignment_id] = {tag.user_id: [tag]}
-                
-        # Calculating interval logs per assignment per user
-        for assignment_id, users in self.assignment_to_users.items():
-            for user,tags in users.items():
-                self.interval_logs_result[assignment_id][user] = self.tagger_classifier.buildIntervalLogs(self.assignment_to_users[assignment_id][user])
-                
-        with open("data/Interval_logs.csv", "w") as f:
-            f.write("Assignment_id,User_id,IL_result,Time,Number_of_Tags\n")
-            for assignment_id, users in self.interval_logs_result.items():
-                for user_id, results in users.items():
-                    log_time_value = results[0]
-                    number_of_tags = results[1]
-                    if log_time is None or log_time_value >= log_time:
-                        # Format IL_result and Time to 3 decimal places
-                        il_result_formatted = "{:.3f}".format(log_time_value)
-                        time_formatted = "{:.3f}".format(pow(2, log_time_value))
-                        f.write(f"{assignment_id},{user_id},{il_result_formatted},{time_formatted},{number_of_tags}\n")
-        print("Interval logs written to data/Interval_logs.csv")
-        f.close()
+        # Calculating interval logs of all users of all assignments together, only from the tags of the users to recompute
+        interval_logs = self.tagger_classifier.computeIntervalLogs(tags if users is None else tags[_userRows(tags, users)])
+        for assignment_id, assignment_users in interval_logs.items():
+            self.interval_logs_result[assignment_id].update(assignment_users)
+
+        # Keeping the users above the log time threshold, the file shows IL_result and Time to 3 decimal places
+        rows = [(assignment_id, user_id, log_time_value, pow(2, log_time_value), number_of_tags)
+                for assignment_id, assignment_users in self.interval_logs_result.items()
+                for user_id, (log_time_value, number_of_tags) in assignment_users.items()
+                if log_time is None or log_time_value >= log_time]
+        self.interval_logs_df = pd.DataFrame(rows, columns=["Assignment_id", "User_id", "IL_result", "Time", "Number_of_Tags"])
+        self._addOutput("Interval_logs.csv", self.interval_logs_df, float_format="%.3f")
     
-    def __getUserHistory(self, user_history) -> None:
+    def __getUserHistory(self, tags, answers, prompts) -> None:
         """
         Processes user tagging history, calculates tag credibility scores, 
-        and writes the results to a CSV.
+        and keeps the results as a table, written to `user_data.csv`.
 
         - **Credibility Score Calculation**:
           * Combines fast tagging log values with Krippendorff's alpha to assess tag reliability.
           * Tags with high credibility scores are deemed more reliable.
           * Credibility score normalization ensures fair comparisons across multiple users:
             Normalized log time and normalized alpha are averaged to determine reliability.
+
+        - **Text Columns**:
+          Questions, review comments and tag prompts are looked up once per distinct question, answer and tag prompt,
+          cleaned once, and kept as categorical columns holding every distinct text once.
         Args:
-            user_history (list): List of user tags fetched from the database.
+            tags (TagTable): Tags of the user history.
+            answers (dict): {answer_id: (question_id, question, answer_score, comments)} of the answers of the tags.
+            prompts (dict): {tag_prompt_id: prompt} of the tag prompts of the tags.
         """         
-        # Populate user_history_dict
-        for tag in user_history:
-            if tag.assignment_id in self.user_history_dict:
-                if tag.user_id in self.user_history_dict[tag.assignment_id]:
-                    self.user_history_dict[tag.assignment_id][tag.user_id].append(tag)
-                else:
-                    self.user_history_dict[tag.assignment_id][tag.user_id] = [tag]
-            else:
-                self.user_history_dict[tag.assignment_id] = {tag.user_id: [tag]}
-
         # Calculate credibility scores for tags
-        credibility_scores = self.tagger_classifier.calculate_tag_credibility_score(user_history)
-
-        # Writing data to CSV with credibility scores
-        with open("data/user_data.csv", "w") as f:
-            f.write("User_id,Assignment_id,Question,Score,Review_Comment,Tag_Prompt,Tag_Value,Credibility_Score\n")
-            for assignment_id, users in self.user_history_dict.items():
-                for user, tags in users.items():                    
-                    for tag in tags:
-                        # Clean 'question' and 'comments' by removing HTML tags and commas
-                        cleaned_question = re.sub('<.*?>', '', tag.question).replace(',', '').replace('\n', '').replace('\r', '')
-                        cleaned_comments = re.sub('<.*?>', '', tag.comments).replace(',', '').replace('\n', '').replace('\r', '')
-                        
-                        # Get credibility score for the tag
-                        tag_credibility_score = credibility_scores.get(tag.id, 0)
-
-                        # Concatenate the cleaned strings with other information and add it to the output string
-                        output_string = f"{str(user)},{str(assignment_id)},{cleaned_question},{tag.answer_score},{cleaned_comments},{tag.prompt},{tag.value},{tag_credibility_score}\n"
-                        f.write(output_string)
-
-            print("User data with credibility scores written to data/user_data.csv")
+        credibility_scores = self.tagger_classifier.calculate_tag_credibility_score(tags)
+
+        # Tags sorted by assignment, user and tag id, so a full and an incremental run write the same rows in the same order
+        # whatever order the snapshot holds the tags in
+        tags = tags[np.lexsort((tags.id, tags.user_id, tags.assignment_id))]
+
+        # Clean 'question' and 'comments' by removing HTML tags and commas, once per question and answer
+        answer_ids, answer_codes = np.unique(tags.answer_id, return_inverse=True)
+        answer_rows = [answers[answer_id] for answer_id in answer_ids.tolist()]
+        questions = {question_id: question for question_id, question, _, _ in answer_rows}
+        cleaned_questions = {question_id: _cleanText(question) for question_id, question in questions.items()}
+        scores = np.array([answer_score for _, _, answer_score, _ in answer_rows], dtype=object)
+        prompt_ids, prompt_codes = np.unique(tags.tag_prompt_id, return_inverse=True)
+
+        self.user_data_df = pd.DataFrame({
+            "User_id": tags.user_id,
+            "Assignment_id": tags.assignment_id,
+            "Question": _encoded([cleaned_questions[question_id] for question_id, _, _, _ in answer_rows], answer_codes),
+            "Score": scores[answer_codes].tolist(),
+            "Review_Comment": _encoded([_cleanText(comments) for _, _, _, comments in answer_rows], answer_codes),
+            "Tag_Prompt": _encoded([prompts[prompt_id] for prompt_id in prompt_ids.tolist()], prompt_codes),
+            "Tag_Value": tags.valueLabels(),
+            "Credibility_Score": [credibility_scores.get(tag_id, 0) for tag_id in tags.id.tolist()],
+        })
+        self._addOutput("user_data.csv", self.user_data_df)
   
     def __getStudentsWhoTagged(self):
 
@@ -143,98 +246,72 @@ class Application:
         **Metrics**:
         Groups data by questions and counts distinct user IDs for each question.
 
-        Writes results to a CSV (`data/number_of_students_who_tagged_each_question.csv`):
+        Keeps the results as a table, written to `number_of_students_who_tagged_each_question.csv`:
         - `Question`: The question being tagged.
         - `Unique_User_Count`: Count of unique users who tagged that question.
 
         """
 
-        # Read the CSV data into a pandas DataFrame
-        df = pd.read_csv(("data/user_data.csv"), encoding='cp1252')
-
-        # Group by 'Question' and count unique 'User_id's
-        unique_users_per_question = df.groupby('Question')['User_id'].nunique()
+        # Group the user data by 'Question' and count unique 'User_id's
+        unique_users_per_question = self.user_data_df.groupby('Question', observed=True)['User_id'].nunique()
 
         # Convert the result to a DataFrame for easier CSV export
         result_df = unique_users_per_question.reset_index()
         result_df.columns = ['Question', 'Unique_User_Count']
+        self._addOutput('number_of_students_who_tagged_each_question.csv', result_df, na_rep=' ', quoting=csv.QUOTE_MINIMAL)
 
-        # Save the result to a new CSV file
-        output_file = 'number_of_students_who_tagged_each_question.csv'
+    def __getKrippendorffAlpha(self, alpha=None, users=None):
+        """
+        Computes Krippendorff's alpha to measure inter-rater reliability (IRR) within teams.
 
-        # Write the combined results to a new CSV file
-        output_path = f"data/{output_file}"
-        result_df.to_csv(output_path, index=False, na_rep=' ',  quoting=csv.QUOTE_MINIMAL)
+        - **Purpose**:
+        Assesses the consistency of taggers in a team by analyzing agreements on assigned tag values.
+        Alpha ranges from -1 (complete disagreement) to 1 (perfect agreement).
 
-        print("Results saved to 'number_of_students_who_tagged_each_question.csv'")
+        - **Process**:
+        - Slices the matrix of each team, where rows = tagged items, columns = users, values = tag values, from the rater matrix.
+        - Uses the matrix to calculate alpha for each team or user.
 
-    def __getKrippendorffAlpha(self, alpha=None):
-            """
-            Computes Krippendorff's alpha to measure inter-rater reliability (IRR) within teams.
+        - **Output**:
+        Keeps `Assignment_id`, `Team_id`, `User_id`, and `Alphas` as a table, written to `krippendorff.csv`.
 
-            - **Purpose**:
-            Assesses the consistency of taggers in a team by analyzing agreements on assigned tag values.
-            Alpha ranges from -1 (complete disagreement) to 1 (perfect agreement).
+        Args:
+            alpha (float, optional): Minimum acceptable alpha for filtering. Defaults to None.
+            users (set, optional): (assignment_id, user_id) pairs whose tags changed; only their teams are recomputed. Defaults to all teams.
+        """
 
-            - **Process**:
-            - Builds a matrix where rows = tagged items, columns = users, values = tag values.
-            - Uses the matrix to calculate alpha for each team or user.
+        #calculating krippendorff's alpha for all users of all teams together, on the tags arranged as an item x rater matrix per team
+        rater_matrix = self.snapshot.raterMatrix() if users is None else self.__changedTeamsMatrix(users)
+        team_alphas = self.tagger_classifier.computeKrippendorffAlphas(rater_matrix)
+        for team in range(len(rater_matrix)):
+            assignment, team_id = rater_matrix.assignment_ids[team].item(), rater_matrix.team_ids[team].item()
+            team_users = rater_matrix.users(team).tolist()
+            if len(team_users)==1:
+                self.krippendorff_result[assignment][team_id] = {team_users[0]: np.nan}
+                continue
+            self.krippendorff_result[assignment][team_id] = team_alphas[team]
+
+        #keeping the krippendorff's alpha if the alpha value is greater than the given alpha value, alphas that are not a number are kept as nan
+        rows = [(assignment_id, team_id, user_id, alpha_value if isinstance(alpha_value, float) else np.nan)
+                for assignment_id, teams in self.krippendorff_result.items()
+                for team_id, users_alphas in teams.items()
+                for user_id, alpha_value in users_alphas.items()]
+        df = pd.DataFrame(rows, columns=["Assignment_id", "Team_id", "User_id", "Alphas"])
+        self.krippendorff_df = df if alpha is None else df[df["Alphas"] >= alpha]
+        self._addOutput("krippendorff.csv", self.krippendorff_df, float_format="%.3f", na_rep="nan")
+     
+    def __changedTeamsMatrix(self, users) -> RaterMatrix:
+        """
+        Builds the item x rater matrix of the teams that have one of the given users, from the tags of their members only
 
-            - **Output**:
-            Writes `Assignment_id`, `Team_id`, `User_id`, and `Alphas` to `data/krippendorff.csv`.
+        Args:
+            users (set): (assignment_id, user_id) pairs whose tags changed.
+        """
+        teams = {(assignment_id, team_id) for assignment_id, user_id, team_id in self.snapshot.team_members if (assignment_id, user_id) in users}
+        members = [member for member in self.snapshot.team_members if (member[0], member[2]) in teams]
+        tags = self.snapshot.tags
+        return RaterMatrix.build(tags[_userRows(tags, {(assignment_id, user_id) for assignment_id, user_id, _ in members})], members)
 
-            Args:
-                alpha (float, optional): Minimum acceptable alpha for filtering. Defaults to None.
-            """
-        
-        for assignment in self.assignment_to_teams:
-            for team in self.assignment_to_teams[assignment].teams:
-                data = []
-                answers = defaultdict(set)
-                users = []
-                
-                #collecting all the tag_prompt_ids for al answers of a team
-                for user in self.assignment_to_teams[assignment].teams[team].users:
-                    users.append(user)
-                    for answer in self.assignment_to_teams[assignment].teams[team].users[user].answers:
-                        for tag in self.assignment_to_teams[assignment].teams[team].users[user].answers[answer].tags:
-                            answers[answer].add(tag)
-                
-                # collecting all the raters data for a single tag_prompt_id
-                for answer in answers:
-                    for tag in answers[answer]:
-                        row = []
-                        for user in self.assignment_to_teams[assignment].teams[team].users:
-                            if answer not in self.assignment_to_teams[assignment].teams[team].users[user].answers:
-                                row.append(np.nan)
-                            elif tag not in self.assignment_to_teams[assignment].teams[team].users[user].answers[answer].tags:
-                                row.append(np.nan)
-                            else:
-                                row.append(self.assignment_to_teams[assignment].teams[team].users[user].answers[answer].tags[tag].value)
-                
-                        data.append(row)
-                if len(data[0])==1:
-                    self.krippendorff_result[assignment][team] = {users[0]: np.nan}
-                    continue
-                data = np.array(data)
-                
-                #calculating krippendorff's alpha for all users in a team for an assignment
-                self.krippendorff_result[assignment][team] = self.tagger_classifier.computeKrippendorffAlpha(data, users)
-        
-        #writing the krippendorff's alpha to a csv file if the alpha value is greater than the given alpha value
-        f = open("data/krippendorff.csv", "w")
-        f.write("Assignment_id,Team_id,User_id,Alphas\n")
-        for assignment_id, teams in self.krippendorff_result.items():
-            for team_id, users_alphas in teams.items():
-                for user_id, alpha_value in users_alphas.items():
-                    # Check if alpha is None or the alpha value is greater or equal than the given alpha threshold
-                    if alpha is None or alpha_value >= alpha:
-                        # Format Alphas to 3 decimal places if it's a float, otherwise write 'nan'
-                        alpha_formatted = "{:.3f}".format(alpha_value) if isinstance(alpha_value, float) else "nan"
-                        f.write(f"{assignment_id},{team_id},{user_id},{alpha_formatted}\n")
-        print("Krippendorff's alpha written to data/krippendorff.csv")
-        f.close()
-     
     def __calculateAgreementDisagreement(self):
         """
         Computes agreement/disagreement among taggers based on the consensus for tag values.
@@ -245,207 +322,146 @@ class Application:
           2. Fraction indicating the level of agreement among users for that value.
           High fraction values indicate agreement; lower values suggest disagreement.
 
-        Writes results to a CSV (`tags.csv`):
+        Keeps the results as a table, written to `tags.csv`:
         - `Assignment_id`, `team_id`, `answer_id`, `tag_prompt_id`
         - `value`: Dominant tag value.
         - `fraction`: Agreement fraction for the tag value.
 
         """
-        for assignment in self.assignment_to_teams:
-            for team in self.assignment_to_teams[assignment].teams:
-                data = []
-                answers = defaultdict(set)
-                
-                #collecting all the tag_prompt_ids for al answers of a team
-                for user in self.assignment_to_teams[assignment].teams[team].users:
-                    for answer in self.assignment_to_teams[assignment].teams[team].users[user].answers:
-                        for tag in self.assignment_to_teams[assignment].teams[team].users[user].answers[answer].tags:
-                            answers[answer].add(tag)
-                
-                # collecting all the raters data for a single tag_prompt_id
-                for answer in answers:
-                    for tag in answers[answer]:
-                        row = []
-                        for user in self.assignment_to_teams[assignment].teams[team].users:
-                            if answer not in self.assignment_to_teams[assignment].teams[team].users[user].answers:
-                                row.append(None)
-                            elif tag not in self.assignment_to_teams[assignment].teams[team].users[user].answers[answer].tags:
-                                row.append(None)
-                            else:
-                                row.append(self.assignment_to_teams[assignment].teams[team].users[user].answers[answer].tags[tag])
-                
-                        data.append(row)
-                if len(data[0])==0:
-                    self.agree_disagree_tags[assignment][team] = np.nan
-                    continue
-                data = np.array(data)
-                
-                #calculating agreement/disagreement of all tags
-                self.agree_disagree_tags[assignment][team] = self.tag_classifier.calculateAgreementDisagreement(data)
-        
-        f = open("data/tags.csv","w")
-        f.write("Assignment_id,team_id,answer_id,tag_prompt_id,value,fraction\n")
-        for i in self.agree_disagree_tags:
-            for j in self.agree_disagree_tags[i]:
-                for k in self.agree_disagree_tags[i][j]:
-                    for l in self.agree_disagree_tags[i][j][k]:
-                        f.write(str(i)+","+str(j)+","+str(k)+","+str(l)+","+str(self.agree_disagree_tags[i][j][k][l][0])+","+str(self.agree_disagree_tags[i][j][k][l][1])+"\n")
-        f.close()        
-        
-    def assignTaggerReliability(self, log_time=None, alpha=None, lmin=5, lmax=30, minrep=15):
-    """
-    Executes the pipeline to evaluate tagger reliability by combining several analyses:
-      1. **Interval Logs**: Measures tagging speed (log transformations of time gaps).
-      2. **Krippendorff Alpha**: Assesses inter-rater agreement to evaluate tag consistency.
-      3. **Pattern Detection**: Detects repetitive tagging behavior (defined by pattern length and repetitions).
-      4. **Credibility Scores**: Combines metrics to quantify individual tagger reliability.
+        #calculating agreement/disagreement of all tags of all teams at once, on the rater matrix
+        self.agree_disagree_tags = self.tag_classifier.agreementTable(self.snapshot.raterMatrix())
+        self._addOutput("tags.csv", self.agree_disagree_tags)
 
-    Args:
-        log_time (float): Minimum threshold for interval log time.
-        alpha (float): Minimum team consistency alpha.
-        lmin (int), lmax (int): Min/max pattern lengths for detection.
-        minrep (int): Minimum repetitions to qualify a pattern.
-    """
-        # Interval logs
-        self.tags = self._connector.getAnswerTags()
-        self.__getIntervalLogs(self.tags, log_time)
-    
-        # Krippendorff alpha
-        self.assignment_to_teams = self._connector.getUserTeams()
-        self.__getKrippendorffAlpha(alpha)
+    def assignTaggerReliability(self, log_time=None, alpha=None, lmin=5, lmax=30, minrep=15, min_run_len=10):
+        """
+        Executes the pipeline to evaluate tagger reliability by combining several analyses:
+          1. **Interval Logs**: Measures tagging speed (log transformations of time gaps).
+          2. **Krippendorff Alpha**: Assesses inter-rater agreement to evaluate tag consistency.
+          3. **Pattern Detection**: Detects repetitive tagging behavior (defined by pattern length and repetitions).
+          4. **Credibility Scores**: Combines metrics to quantify individual tagger reliability.
+
+        Args:
+            log_time (float): Minimum threshold for interval log time.
+            alpha (float): Minimum team consistency alpha.
+            lmin (int), lmax (int): Min/max pattern lengths for detection.
+            minrep (int): Minimum repetitions to qualify a pattern.
+            min_run_len (int): Minimum length of the runs of consecutive 'Y's and 'N's.
+        """
+        # A single scan of the tag rows, plus the membership and text side tables, feeds every view of the data.
+        # It is read from the local cache unless the tags changed since it was written
+        self.snapshot = Snapshot.loadCached(self._connector, self.cache_dir, self.batch_size, self.refresh, self.incremental)
+
+        self.parameters = {"log_time": log_time, "alpha": alpha, "lmin": lmin, "lmax": lmax, "minrep": minrep, "min_run_len": min_run_len,
+                           "output_format": self.output_format, "watermark": {assignment_id: list(mark) for assignment_id, mark in self.snapshot.watermark.items()}}
+
+        # In incremental mode the results of the previous run are restored and only the users
+        # and teams touched by the tags updated since then are recomputed
+        pattern_params = {"lmin": lmin, "lmax": lmax, "minrep": minrep}
+        changed_users, pattern_users = self._loadState(pattern_params) if self.incremental else (None, None)
+
+        # The stages only depend on the snapshot and their own parameters, except the students count which reads the user history.
+        # The agreement of the tags is a stage as well, so tags.csv is part of the outputs of every run.
+        # Independent stages run concurrently and the output of every stage is memoized under a hash of the snapshot
+        # watermark and its parameters, so a run changing a single parameter only recomputes the stages using it
+        tags = self.snapshot.tags
+        stages = [
+            Stage("interval_logs", self._stageRun(lambda: self.__getIntervalLogs(tags, log_time, changed_users),
+                                                  ["interval_logs_result", "interval_logs_df"], ["Interval_logs.csv"]),
+                  ["snapshot"], {"log_time": log_time}, version=2),
+            Stage("krippendorff", self._stageRun(lambda: self.__getKrippendorffAlpha(alpha, changed_users),
+                                                 ["krippendorff_result", "krippendorff_df"], ["krippendorff.csv"]),
+                  ["snapshot"], {"alpha": alpha}, version=2),
+            Stage("agreement", self._stageRun(self.__calculateAgreementDisagreement, ["agree_disagree_tags"], ["tags.csv"]), ["snapshot"], version=2),
+            Stage("patterns", self._stageRun(lambda: self.__getPatternResults(tags, lmin, lmax, minrep, pattern_users, min_run_len),
+                                             ["pattern_detection_result", "pattern_results_df", "longest_y_n_df"],
+                                             ["user_tags.csv", "Longest_Y_N.csv", "Pattern_recognition.txt"]),
+                  ["snapshot"], {**pattern_params, "min_run_len": min_run_len}),
+            Stage("user_history", self._stageRun(lambda: self.__getUserHistory(self.snapshot.historyTags(), self.snapshot.answers, self.snapshot.prompts),
+                                                 ["user_data_df"], ["user_data.csv"]),
+                  ["snapshot"], version=3),
+            Stage("students", self._stageRun(self.__getStudentsWhoTagged, [], ["number_of_students_who_tagged_each_question.csv"]),
+                  ["user_history"]),
+        ]
+        snapshot_key = (self.assignment_ids, [(assignment_id, str(np.datetime64(updated_at, "us")), count)
+                                              for assignment_id, (updated_at, count) in sorted(self.snapshot.watermark.items())])
+        graph = StageGraph(stages, {"snapshot": snapshot_key}, os.path.join(self.cache_dir, "stages"), reuse=not self.refresh)
+        stage_outputs = graph.run(self._applyStage)
+
+        # Output files are registered in the order of the stages, whatever order they finished in
+        self.outputs = {file_name: output for stage in stages for file_name, output in stage_outputs[stage.name]["outputs"].items()}
+        self._saveState(pattern_params)
+
+    def _stageRun(self, method, attributes, files):
+        """
+        Wraps a stage method into the function run by its stage. The output of the stage is the attributes the
+        method sets and the outputs it registers, so a memoized output restores the same state.
 
-        # # Pattern Detection
-        self.__getPatternResults(self.tags, lmin, lmax, minrep)
+        Args:
+            method (callable): Stage method, setting attributes of the application and registering its output files.
+            attributes (list): Attributes set by the method.
+            files (list): Output files registered by the method.
+        """
+        def run():
+            method()
+            return {"attributes": {attribute: getattr(self, attribute) for attribute in attributes},
+                    "outputs": {file_name: self.outputs[file_name] for file_name in files}}
+        return run
 
-        # User data
-        self.user_history = self._connector.getUserHistory()
-        self.__getUserHistory(self.user_history)
+    def _applyStage(self, name, output) -> None:
+        """
+        Sets the attributes of the application from the output of a stage, computed or memoized
+        """
+        for attribute, value in output["attributes"].items():
+            setattr(self, attribute, value)
 
-        #Number of students who tagged each question
-        self.__getStudentsWhoTagged()
-        
     def assignTagReliability(self):
         """
-        Function used to compute Agreement/Disagreement of tags
+        Function used to compute Agreement/Disagreement of tags on its own and write `tags.csv` right away.
+        assignTaggerReliability computes it as one of its stages, this loads the snapshot first if it has not run.
         """
+        if self.snapshot is None:
+            self.snapshot = Snapshot.loadCached(self._connector, self.cache_dir, self.batch_size, self.refresh, self.incremental)
         self.__calculateAgreementDisagreement()
+        writer, df, options = self.outputs["tags.csv"]
+        writer(df, self._outputPath("tags.csv"), **options)
+        print(f"tags.csv written to {self._outputPath('tags.csv')}")
 
 
 
-    def find_long_consecutiveY(self, string):
-    """
-    Finds sequences of at least 10 consecutive 'Y's (yes tags) in the tagging history.
-
-    - **Purpose**:
-      Detects repetitive, predictable sequences in 'Y' tags, which may indicate biased tagging behavior.
-
-    Args:
-        string (dict): A dictionary containing a "Tags" string with 'Y'/'N' values.
-
-    Returns:
-        list: Lengths of 'Y' sequences where length > 10.
-    """
-        substrings = []
-        current_length = 0
-        for c in string["Tags"]:
-            if c == 'Y':
-                current_length += 1
-            else:
-                if current_length >= 10:
-                    substrings.append(current_length)
-                current_length = 0
-        # Check the last substring
-        if current_length > 10:
-            substrings.append(current_length)
-
-        return substrings
-
-    def find_long_consecutiveN(self, string):
-    """
-    Finds sequences of at least 10 consecutive 'N's (no tags) in the tagging history.
-
-    - **Purpose**:
-      Identifies long runs of 'N' tags, potentially exposing tagging irregularities or patterns.
-
-    Args:
-        string (dict): Dictionary with a "Tags" string containing 'Y'/'N' values.
-
-    Returns:
-        list: Lengths of 'N' sequences where length > 10.
-    """
-        substrings = []
-        current_length = 0
-        for c in string["Tags"]:
-            if c == 'N':
-                current_length += 1
-            else:
-                if current_length > 10:
-                    substrings.append(current_length)
-                current_length = 0
-        # Check the last substring
-        if current_length > 10:
-            substrings.append(current_length)
-
-        return substrings
-
-    def replace(self, tag_list):
-    """
-    Converts raw tag data into a cleaned format by mapping:
-      - `1` -> 'Y', `-1` -> 'N', and removing all other values.
-
-    - **Purpose**:
-      Prepares tag data for analysis by normalizing inconsistent or irrelevant values.
-
-    Args:
-        tag_list (str): String representation of tags (e.g., "[1, -1, 1]").
-
-    Returns:
-        list: A cleaned list of 'Y' and 'N' values.
-    """
-
-        # Convert the string representation of a list to an actual list
-        tag_list = ast.literal_eval(tag_list)
-
-        # Replace '1' with 'Y' and '-1' with 'N', and remove all other elements
-        tag_list = ['Y' if tag == '1' else 'N' if tag == '-1' else None for tag in tag_list]
-        tag_list = [tag for tag in tag_list if tag is not None]
-
-        return tag_list
-    
-    def find_Ys_Ns(self, tags_file_path):
-
-            """
-            Processes tag data from a CSV file to identify repetitive patterns of 'Y's and 'N's.
+    def find_Ys_Ns(self, sequences, min_run_len=10):
+        """
+        Identifies long runs of 'Y's and 'N's in the tag sequences of the users.
 
-            - **Actions**:
-            - Reads and cleans the "Tags" column.
-            - Calculates the longest sequences of consecutive 'Y's and 'N's.
-            - Records totals of repetitive patterns.
+        - **Actions**:
+        - Keeps the 'Y' (`1`) and 'N' (`-1`) tags of every user, in the order they were created.
+        - Finds the runs of consecutive 'Y's and 'N's of at least `min_run_len` tags, for all users at once.
+        - Records totals of repetitive patterns.
 
-            - **Output**:
-            Writes longest sequence information to `data/Longest_Y_N.csv`.
+        - **Output**:
+        Keeps longest sequence information as a table, written to `Longest_Y_N.csv`.
 
-            Args:
-                tags_file_path (str): Path to the CSV containing raw tag data.
-            """
-        # Read the CSV file
-        df = pd.read_csv(tags_file_path)
+        Args:
+            sequences (list[tuple]): (user_id, tag values) of every user, the values as int8 codes in the order they were created.
+            min_run_len (int): Minimum length of a reported run.
+        """
+        # Runs continue across tags that are neither Y nor N, as those are left out
+        values = [user_values[(user_values == 1) | (user_values == -1)] for _, user_values in sequences]
+        long_runs = self.pattern_detection.LongRuns(np.concatenate(values) if values else np.empty(0, dtype=np.int8),
+                                                    [len(user_values) for user_values in values], {1: min_run_len, -1: min_run_len})
 
-        df['Tags'] = df['Tags'].apply(self.replace)
-        df['Tags'] = df['Tags'].apply(lambda x: eval(x) if isinstance(x, str) else x)
-        df['Consecutive Ys Pattern Count'] = ''
-        df['Consecutive Ns Pattern Count'] = ''
-        df['Consecutive Ys Pattern Count'] = df.apply(self.find_long_consecutiveY, axis = 1)
-        df['Consecutive Ns Pattern Count'] = df.apply(self.find_long_consecutiveN, axis = 1)
-        df['Total Repeating Ys'] = df['Consecutive Ys Pattern Count'].apply(lambda arr: int(np.sum(arr)))
-        df['Total Repeating Ns'] = df['Consecutive Ns Pattern Count'].apply(lambda arr: int(np.sum(arr)))
+        df = pd.DataFrame({"User": [user for user, _ in sequences],
+                           "Tags": [np.where(user_values == 1, "Y", "N").tolist() for user_values in values]})
+        df['Consecutive Ys Pattern Count'] = long_runs[1]
+        df['Consecutive Ns Pattern Count'] = long_runs[-1]
+        df['Total Repeating Ys'] = [sum(runs) for runs in long_runs[1]]
+        df['Total Repeating Ns'] = [sum(runs) for runs in long_runs[-1]]
 
-        df.to_csv('data/Longest_Y_N.csv', index = False)
-        print("Consecutive Ys and Ns Pattern results written to 'data/Longest_Y_N.csv'")
+        self.longest_y_n_df = df
+        self._addOutput('Longest_Y_N.csv', df)
 
 
 
-    def __getPatternResults(self, tags, lmin=5, lmax=30, minrep=15) -> None:
+    def __getPatternResults(self, tags, lmin=5, lmax=30, minrep=15, users=None, min_run_len=10) -> None:
         """
         Performs pattern detection to identify repetitive sequences in user tagging behaviors.
 
@@ -454,157 +470,168 @@ class Application:
         - Includes patterns that occur at least `minrep` times.
 
         - **Output**:
-        Writes pattern results (`Assignment_id`, `User_id`, `Pattern`, `Repetitions`) to a summary file.
+        Keeps pattern results (`Assignment_id`, `User_id`, `Pattern`, `Repetitions`) as a table, written to a summary file.
 
         Args:
-            tags (list): Tag data to analyze.
+            tags (TagTable): Tags of the assignments.
             lmin (int): Minimum pattern length.
             lmax (int): Maximum pattern length.
             minrep (int): Minimum repetitions for a valid pattern.
+            users (set, optional): (assignment_id, user_id) pairs to recompute, the results of other users are kept. Defaults to all users.
+            min_run_len (int): Minimum length of the runs of consecutive 'Y's and 'N's.
         """
-        # Populating the assignment_to_users hashmap
-        for tag in tags:
-            if tag.assignment_id in self.assignment_to_user:
-                if tag.user_id in self.assignment_to_user[tag.assignment_id]:
-                    self.assignment_to_user[tag.assignment_id][tag.user_id].append(tag)
-                else:
-                    self.assignment_to_user[tag.assignment_id][tag.user_id] = [tag]
-            else:
-                self.assignment_to_user[tag.assignment_id] = {tag.user_id: [tag]}
-        
+        # Populating the assignment_to_users hashmap with a view on the tags of every assignment_id and user_id
+        for (assignment_id, user_id), user_tags in tags.groupBy("assignment_id", "user_id"):
+            self.assignment_to_users[assignment_id][user_id] = user_tags
 
         # Calculating pattern detection results for each assignment and user
-        for assignment_id, users in self.assignment_to_user.items():
-            user_df = pd.DataFrame(columns = ["User", "Tags"])
-            for user, tags in users.items():
-                
-
-                temp_tags = tags
-                temp_tags.sort(key=lambda l: l.created_at)
-                temp_bin_data = [i.value for i in temp_tags]
-                temp_user = pd.DataFrame({"User": user, "Tags": [temp_bin_data]})
-                user_df = pd.concat([user_df, temp_user], ignore_index=True)
+        sequences = []
+        pending = []
+        for assignment_id, assignment_users in self.assignment_to_users.items():
+            for user, tags in assignment_users.items():
+                values = tags.sortedBy("created_at").value
+                sequences.append((user, values))
+
+                if users is not None and (assignment_id, user) not in users:
+                    continue
+                pending.append((assignment_id, user, values))
 
+        pattern_results = self.__detectPatterns([values for _, _, values in pending], lmin, lmax, minrep)
+        for (assignment_id, user, _), user_patterns in zip(pending, pattern_results):
+            self.pattern_detection_result[assignment_id][user] = user_patterns
 
-                pattern_results = self.pattern_detection.PTV(tags, lmin, lmax, minrep)
-                self.pattern_detection_result[assignment_id][user] = pattern_results
+        user_df = pd.DataFrame({"User": [user for user, _ in sequences], "Tags": [decodeValues(values) for _, values in sequences]})
+        self._addOutput("user_tags.csv", user_df)
 
-            user_df.to_csv("data/user_tags.csv", index=False)
-            print("User Tags are written to 'data/user_tags.csv'")
-        
-        self.find_Ys_Ns("data/user_tags.csv")
+        self.find_Ys_Ns(sequences, min_run_len)
         
-        # Writing the pattern detection results to a file
-        with open("data/Pattern_recognition.txt", "w") as f:
-            f.write("Assignment_id/User_id/PD_result/Pattern/Repetition\n")
-            for assignment_id, users in self.pattern_detection_result.items():
-                for user, patterns in users.items():
-                    for pattern, count in patterns:
-                        if pattern != "Not_found":
-                            f.write(f"{assignment_id}/{user}/Found/{pattern}/{count}\n")
-                        else:
-                            f.write(f"{assignment_id}/{user}/Not_found\n")
-        print("Pattern recognition results written to data/Pattern_recognition.txt")
-    
+        # One row per pattern found, a single Not_found row for users without one
+        rows = []
+        for assignment_id, users in self.pattern_detection_result.items():
+            for user, patterns in users.items():
+                for pattern, count in patterns:
+                    if pattern != "Not_found":
+                        rows.append((assignment_id, user, "Found", pattern, count))
+                    else:
+                        rows.append((assignment_id, user, "Not_found", None, None))
+        self.pattern_results_df = pd.DataFrame(rows, columns=["Assignment_id", "User_id", "PD_result", "Pattern", "Repetition"]).astype({"Repetition": "Int64"})
+        self._addOutput("Pattern_recognition.txt", self.pattern_results_df, _writePatternResults)
+
+    def __detectPatterns(self, sequences, lmin, lmax, minrep) -> list:
+        """
+        Runs pattern detection on the tag sequences of several users, spread over `self.workers` processes.
+
+        - The sequences are sent as one array of tag values plus offsets per chunk, the chunks being sized by the
+          estimated cost of every sequence, its length times the number of pattern lengths it is searched for.
+        - Results come back in the order of the sequences whatever the number of workers.
+
+        Args:
+            sequences (list[array]): int8 tag values of every user, in the order they were created.
+            lmin (int), lmax (int): Min/max pattern lengths for detection.
+            minrep (int): Minimum repetitions for a valid pattern.
+
+        Returns:
+            list: PTV result of every sequence.
+        """
+        lengths = np.array([len(values) for values in sequences], dtype=np.int64)
+        offsets = np.concatenate(([0], np.cumsum(lengths)))
+        values = np.concatenate(sequences) if sequences else np.empty(0, dtype=np.int8)
+        if self.workers <= 1 or len(sequences) < 2:
+            return detectPatterns(values, offsets, lmin, lmax, minrep)
+
+        periods = np.clip(np.minimum(lmax, lengths // 2) - max(lmin, 1) + 1, 0, None) * (lengths >= minrep)
+        bounds = costChunks(lengths * (periods + 1), self.workers * 4)
+        chunk_values = [values[offsets[start]:offsets[end]] for start, end in zip(bounds[:-1], bounds[1:])]
+        chunk_offsets = [offsets[start:end + 1] - offsets[start] for start, end in zip(bounds[:-1], bounds[1:])]
+        # The pool is started from a stage thread, so its processes come from a fork server rather than a fork of this threaded process.
+        # Windows has no fork server, processes are spawned there
+        start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context(start_method)) as executor:
+            chunks = executor.map(detectPatterns, chunk_values, chunk_offsets, repeat(lmin), repeat(lmax), repeat(minrep))
+            return [result for chunk in chunks for result in chunk]
+
     def calculate_credibility(self, log_time, alpha, total_characters, log_time_max, alpha_max, characters_max):
-            """
-            Calculates a credibility score for a tagger based on three metrics:
-            1. **Tagging Speed**: Normalized log time of tag intervals.
-            2. **Inter-Rater Reliability**: Normalized Krippendorff's alpha.
-            3. **Tag Complexity**: Penalizes overly repetitive or simple patterns.
-
-            - **Credibility Formula**:
-            Credibility = (Norm_Log_Time + Norm_Alpha + Norm_Tag_Complexity) / 3
-
-            Args:
-                log_time (float): Log time of intervals between tags.
-                alpha (float): Krippendorff's alpha for agreement reliability.
-                total_characters (float): Total tag sequence length contributed by this user.
-                log_time_max (float): Maximum observed log time.
-                alpha_max (float): Maximum observed alpha.
-                characters_max (float): Maximum observed tag length.
-
-            Returns:
-                float: Credibility score in the range [0, 1].
-            """
-
-        # Check and handle non-numeric or missing values
-        log_time = 0 if not isinstance(log_time, (int, float)) or pd.isna(log_time) else log_time
-        alpha = 0 if not isinstance(alpha, (int, float)) or pd.isna(alpha) else alpha
-        total_characters = 0 if not isinstance(total_characters, (int, float)) or pd.isna(total_characters) else total_characters
-
-        normalized_log_time = log_time / log_time_max if log_time_max != 0 else 0
-        normalized_alpha = alpha / alpha_max if alpha_max != 0 else 0
-        normalized_characters = 1 - (total_characters / characters_max if characters_max != 0 else 0)
-        
-        credibility = (normalized_log_time + normalized_alpha + normalized_characters) / 3
-        return round(credibility, 5)
-    
+        """
+        Calculates the credibility scores of the taggers based on three metrics, for all taggers at once:
+        1. **Tagging Speed**: Normalized log time of tag intervals.
+        2. **Inter-Rater Reliability**: Normalized Krippendorff's alpha.
+        3. **Tag Complexity**: Penalizes overly repetitive or simple patterns.
+
+        - **Credibility Formula**:
+        Credibility = (Norm_Log_Time + Norm_Alpha + Norm_Tag_Complexity) / 3
 
+        Args:
+            log_time (Series): Log time of intervals between tags of every tagger.
+            alpha (Series): Krippendorff's alpha for agreement reliability of every tagger.
+            total_characters (Series): Total tag sequence length contributed by every tagger.
+            log_time_max (float): Maximum observed log time.
+            alpha_max (float): Maximum observed alpha.
+            characters_max (float): Maximum observed tag length.
 
-    def remove_indices_smaller(self, pattern, rep):
+        Returns:
+            Series: Credibility score of every tagger in the range [0, 1].
         """
-        Filters out patterns with insufficient diversity (fewer than 2 unique elements).
 
-        - **Purpose**:
-        Ensures only meaningful tag patterns are included in analysis by removing overly simplistic patterns.
+        # Non-numeric or missing values count as 0
+        log_time, alpha, total_characters = (pd.to_numeric(pd.Series(values), errors="coerce").fillna(0) for values in (log_time, alpha, total_characters))
+
+        normalized_log_time = _normalized(log_time, log_time_max)
+        normalized_alpha = _normalized(alpha, alpha_max)
+        normalized_characters = 1 - _normalized(total_characters, characters_max)
+
+        credibility = (normalized_log_time + normalized_alpha + normalized_characters) / 3
+        return credibility.round(5)
+
+    def update_results(self, df, pattern_users, patterns, repetitions):
+        """
+        Keeps only the patterns mixing 'Y's and 'N's in the results, as lists per user, and counts their repeating characters.
 
         Args:
-            pattern (list): List of patterns detected.
-            rep (list): List of repetition counts for corresponding patterns.
+            df (DataFrame): Results, one row per user.
+            pattern_users (array): Row of the user of every pattern found.
+            patterns (Series): Every pattern found, as a string of 'Y's and 'N's.
+            repetitions (array): Repetitions of every pattern found.
 
         Returns:
-            list: Filtered list of valid patterns.
-        """
-        indices_to_remove = [i for i, p in enumerate(pattern) if len(set(p))<2]
-        return [r for i, r in enumerate(rep) if i not in indices_to_remove]
-
-    def update_results(self, path):
-        df = pd.read_csv(path)
-        df['Pattern'] = df['Pattern'].fillna(df['Pattern'].apply(lambda x: []))
-        df['Pattern Repetition'] = df['Pattern Repetition'].fillna(df['Pattern Repetition'].apply(lambda x: []))
-        df['Pattern Repetition'] = df['Pattern Repetition'].apply(lambda x: eval(x) if isinstance(x, str) else x)
-        df['Pattern'] = df['Pattern'].apply(lambda x: eval(x) if isinstance(x, str) else x)
-        df['Pattern Repetition'] = df.apply(lambda row: self.remove_indices_smaller(row['Pattern'], row['Pattern Repetition']), axis=1)
-        df['Pattern'] = df['Pattern'].apply(lambda x:[item for item in x if len(set(item)) > 1])
-        df['Total Repeating Characters'] = df['Pattern Repetition'].apply(lambda arr: int(np.sum(arr)))
-        
+            DataFrame: The results with their pattern columns updated.
+        """
+        df = df.copy()
+        mixed = (patterns.str.contains('Y', regex=False) & patterns.str.contains('N', regex=False)).to_numpy(dtype=bool)
+        users, repetitions = pattern_users[mixed], repetitions[mixed]
+        df['Pattern'] = _lists(patterns.to_numpy()[mixed], users, len(df))
+        df['Pattern Repetition'] = _lists(repetitions, users, len(df))
+        df['Total Repeating Characters'] = np.bincount(users, weights=repetitions, minlength=len(df)).astype(np.int64)
+
         # Check for pattern existence and create new column
-        df['Pattern Found or Not'] = df['Pattern'].apply(lambda patterns: 'Found' if any(patterns) else 'Not Found')
-    
+        df['Pattern Found or Not'] = np.where(np.bincount(users, minlength=len(df)) > 0, 'Found', 'Not Found')
         return df
 
-    def process_and_save_final_results(self, results_filename, longest_yn_filename, output_filename):
-            """
-            Merges results from multiple tagging analyses into a final summary.
-
-            - **Inputs**:
-            Combines interval logs, Krippendorff alpha, and pattern analysis results.
+    def process_and_save_final_results(self, df, long_y_n, output_filename):
+        """
+        Merges results from multiple tagging analyses into a final summary.
 
-            - **Output**:
-            Saves a formatted CSV file containing user performance summaries.
+        - **Inputs**:
+        Combines interval logs, Krippendorff alpha, and pattern analysis results.
 
-            Args:
-                results_filename (str): File with tagging performance results.
-                longest_yn_filename (str): File with longest 'Y'/'N' patterns.
-                output_filename (str): Final output file path.
-            """
-            # Read CSV files
-            long_y_n = pd.read_csv(longest_yn_filename)
-            df = pd.read_csv(results_filename)
-            
-            # Merge DataFrames
-            merged_df = df.merge(long_y_n, left_on='User ID', right_on='User')
-            
-            # Reorder columns and rename Credibility column
-            cred_column = merged_df.pop("Credibility")
-            merged_df["Credibility"] = cred_column
-            merged_df.drop(columns=["User", "Tags"], inplace=True)
+        - **Output**:
+        Saves a formatted CSV file containing user performance summaries.
 
-            # Save to CSV
-            merged_df.to_csv(output_filename, index=False)
+        Args:
+            df (DataFrame): Tagging performance results.
+            long_y_n (DataFrame): Longest 'Y'/'N' patterns.
+            output_filename (str): Final output file name.
+        """
+        # Merge DataFrames
+        merged_df = df.merge(long_y_n, left_on='User ID', right_on='User')
+        
+        # Reorder columns and rename Credibility column
+        cred_column = merged_df.pop("Credibility")
+        merged_df["Credibility"] = cred_column
+        merged_df.drop(columns=["User", "Tags"], inplace=True)
 
-            print(f"Final file combining all the results is written at {output_filename}")
+        # Save to CSV
+        self._addOutput(output_filename, merged_df, _writeResultsCsv)
+        return merged_df
 
 
 
@@ -617,16 +644,11 @@ class Application:
         Provides a comprehensive summary of tagging quality for all users.
 
         Args:
-        output_file (str): Path to save the final combined CSV.
+        output_file (str): Name of the combined CSV in the output directory.
         """
-        # Read the CSV files into DataFrames
-        interval_logs_df = pd.read_csv("data/Interval_logs.csv")
-        krippendorff_df = pd.read_csv("data/krippendorff.csv")
-        pattern_results_df = pd.read_csv("data/Pattern_recognition.txt", sep="/", header=0, names=["Assignment_id", "User_id", "PD_result", "Pattern", "Repetition"])
-
-        # Merge the DataFrames on 'Assignment_id' and 'User_id'
-        merged_df = interval_logs_df.merge(krippendorff_df, on=['Assignment_id', 'User_id'])
-        merged_df = merged_df.merge(pattern_results_df, on=['Assignment_id', 'User_id'])
+        # Merge the tables of the stages on 'Assignment_id' and 'User_id'
+        merged_df = self.interval_logs_df.merge(self.krippendorff_df, on=['Assignment_id', 'User_id'])
+        merged_df = merged_df.merge(self.pattern_results_df, on=['Assignment_id', 'User_id'])
 
         # Ensure the 'Time' column is present after the merge
         print(merged_df.columns)
@@ -634,84 +656,226 @@ class Application:
         # Replace 'N/A' with a space in the entire DataFrame
         merged_df.replace('N/A', ' ', inplace=True)
         
-        # Replace '-1' with a space in the 'Fast Tagging Log Values' column
-        merged_df['IL_result'] = merged_df['IL_result'].apply(lambda x: ' ' if x == -1 else x)
+        # Users with a single tag have no interval log (-1), it is left blank in the 'Fast Tagging Log Values' column
+        merged_df['IL_result'] = merged_df['IL_result'].where(merged_df['IL_result'] != -1)
 
-        # Replace pattern strings like "('-1', '1', '1', '-1', '1', '1')" with "NYYNYY"
-        merged_df['Pattern'] = merged_df['Pattern'].apply(
-            lambda x: ''.join(['Y' if num == '1' else 'N' for num in ast.literal_eval(x)]) 
-                    if isinstance(x, str) and x.startswith('(') else x
-        )
-            
-        # Adding the 'Number of Tags Available' column using 'team_id'
-        merged_df['Number_of_Tags_Available'] = merged_df['Team_id'].apply(lambda team_id: self._connector.getAnswerCount(team_id))
+        # Adding the 'Number of Tags Available' column using 'team_id', counted for all teams with a single grouped query
+        export_path = self._outputPath("answers.csv") if self.export_answers else None
+        answer_counts = self._connector.getAnswerCounts(merged_df['Team_id'].unique(), export_path)
+        merged_df['Number_of_Tags_Available'] = merged_df['Team_id'].map(answer_counts)
 
 
         # Adjust the column order and rename as needed
         merged_df = merged_df[['User_id', 'Assignment_id', 'Team_id', 'IL_result', 'Time', 'Alphas', "Number_of_Tags", "Number_of_Tags_Available",  'PD_result', 'Pattern', 'Repetition']]
         merged_df.columns = ['User ID', 'Assignment ID', 'Team ID', 'Fast Tagging Log Values', 'Fast Tagging Seconds', 'Alpha Values', 'Number of Tags Set', 'Number of Tags Available', 'Pattern Found or Not', 'Pattern', 'Pattern Repetition']
 
-        #Ensuring that patterns of a single user appear in the same line
+        #Ensuring that a single user appears in a single line
         agg_funcs = {'Assignment ID': 'min','Team ID':'min','Fast Tagging Log Values' :'min', 'Fast Tagging Seconds':'min','Alpha Values':'min','Number of Tags Set':'min',
-             'Number of Tags Available':'min','Pattern Found or Not':'first', 'Pattern': lambda x: x.tolist(),'Pattern Repetition': lambda x: x.tolist()}
+             'Number of Tags Available':'min','Pattern Found or Not':'first'}
         # Group by 'id' and aggregate selected columns
         result_df = merged_df.groupby('User ID', as_index=False).agg(agg_funcs)
 
-        #removing 'nan' values for users where no pattern was found
-        rows_not_found = result_df[result_df['Pattern Found or Not'] == 'Not_found'].index
-        columns_to_blank = ['Pattern', 	'Pattern Repetition']  
-        result_df.loc[rows_not_found, columns_to_blank] = ''
-
-        #removing single quotes for each pattern found inside the array
-        result_df['Pattern'] = result_df['Pattern'].replace({'["\']': ''}, regex=True) 
-
-        #function that calculates the result of pattern length * pattern repetition
-        def calculate_score(row):
-            # Split the columns
-            patterns = row['Pattern']
-            repetitions = row['Pattern Repetition']
-
-            # Check if 'Pattern' and 'Pattern Repetition' are not None and not empty lists
-            if patterns is not None and repetitions is not None and patterns and repetitions:
-                total_score = sum(len(pattern) * repetition for pattern, repetition in zip(patterns, repetitions))
-                return total_score if total_score != 0 else None
-            else:
-                return None        
-
-        # Apply the function 
-        result_df['Total Repeating Characters'] = result_df.apply(calculate_score, axis=1)
-
-        # Handling any Nan values or cases where no pattern is found
-        rows = result_df[result_df['Pattern Found or Not'] == 'Not_found'].index
-        result_df.loc[rows, 'Total Repeating Characters'] = 0  # Set to 0 instead of empty string
+        # One row per pattern found, with the row of its user in the results. Patterns like ('-1', '1', '1', '-1', '1', '1') become "NYYNYY"
+        found = merged_df[merged_df['Pattern Found or Not'] == 'Found']
+        pattern_users = pd.Index(result_df['User ID']).get_indexer(found['User ID'])
+        names = {pattern: ''.join(['Y' if num == '1' else 'N' for num in pattern]) for pattern in set(found['Pattern'])}
+        patterns = pd.Series([names[pattern] for pattern in found['Pattern']], dtype=object)
+        repetitions = found['Pattern Repetition'].to_numpy(dtype=np.int64)
 
+        # Pattern length * pattern repetition, summed over the patterns of every user
+        result_df['Total Repeating Characters'] = np.bincount(pattern_users, weights=patterns.str.len().to_numpy() * repetitions, minlength=len(result_df)).astype(np.int64)
 
          # Find the maximum values for normalization
         log_time_max = result_df['Fast Tagging Seconds'].max()
         alpha_max = result_df['Alpha Values'].max()
         characters_max = result_df['Total Repeating Characters'].max()
 
-        # Calculate credibility for each row
-        result_df['Credibility'] = result_df.apply(lambda row: self.calculate_credibility(
-            row['Fast Tagging Seconds'], row['Alpha Values'], row['Total Repeating Characters'],
-            log_time_max, alpha_max, characters_max
-        ), axis=1)
+        # Calculate credibility for all users at once
+        result_df['Credibility'] = self.calculate_credibility(result_df['Fast Tagging Seconds'], result_df['Alpha Values'], result_df['Total Repeating Characters'],
+                                                              log_time_max, alpha_max, characters_max)
+
+        # Update the results for non-consecutive patterns
+        result_df = self.update_results(result_df, pattern_users, patterns, repetitions)
 
         # Adjust the column order and rename as needed
         result_df = result_df[['User ID', 'Assignment ID', 'Team ID', 'Fast Tagging Log Values', 'Fast Tagging Seconds', 'Alpha Values', 'Number of Tags Set', 'Number of Tags Available', 'Pattern Found or Not', 'Pattern', 'Pattern Repetition','Total Repeating Characters', 'Credibility']]
+        self._addOutput(output_file, result_df, _writeResultsCsv)
+
+        # Writing the table of every stage and the final results, which are the only file written if write_intermediate is not set
+        results_name = "-".join(str(assignment_id) for assignment_id in self.assignment_ids)
+        self.process_and_save_final_results(result_df, self.longest_y_n_df, f"{results_name}_Tagger_Results.csv")
+        self.writeOutputs([f"{results_name}_Tagger_Results.csv"])
+        results_file = f"{results_name}_Tagger_Results.csv"
+        return self._outputPath(results_file if self.output_format != "parquet" else _parquetName(results_file))
+
+
+_HTML_TAGS = re.compile('<.*?>')
+
+
+def _cleanText(text) -> str:
+    """
+    Removes HTML tags, commas and line breaks from a question or review comment
+    """
+    return _HTML_TAGS.sub('', text).replace(',', '').replace('\n', '').replace('\r', '')
+
+
+def _encoded(texts, codes) -> pd.Categorical:
+    """
+    Dictionary-encodes a text column from the text of every code, equal texts sharing one category
+
+    Args:
+        texts (list): text of every code
+        codes (array): code of every row
+
+    Returns:
+        Categorical: the text of every row, categories sorted
+    """
+    text_codes, categories = pd.factorize(np.array(texts, dtype=object), sort=True)
+    return pd.Categorical.from_codes(text_codes[codes], categories)
+
+
+def _userRows(tags, users) -> np.ndarray:
+    """
+    Returns the mask of the tags of the given (assignment_id, user_id) pairs
+    """
+    pairs = np.array(sorted(users), dtype=np.int64).reshape(-1, 2)
+    return np.isin((tags.assignment_id.astype(np.int64) << 32) | (tags.user_id.astype(np.int64) & 0xFFFFFFFF),
+                   (pairs[:, 0] << 32) | (pairs[:, 1] & 0xFFFFFFFF))
+
 
-        # Write the combined results to a new CSV file
-        output_path = f"data/{output_file}"
-        result_df.to_csv(output_path, index=False, na_rep=' ')
+def _writeCsv(df, path, **csv_options) -> None:
+    """
+    Writes a table to a CSV file, without its index
+    """
+    df.to_csv(path, index=False, **csv_options)
+
+
+def _writeResultsCsv(df, path) -> None:
+    """
+    Writes final results to a CSV file, the interval logs and alphas rounded for display and missing values left blank
+    """
+    _rounded(df).to_csv(path, index=False, na_rep=' ')
 
-        # Update the result files for non-consecutive patterns
-        result_df = self.update_results(output_path)
-        result_df.to_csv(output_path, index=False, na_rep=' ')
 
+def _parquetName(file_name) -> str:
+    """
+    Returns the name of the Parquet file an output is written to
+    """
+    return os.path.splitext(file_name)[0] + ".parquet"
 
-        print(f"Combined CSV created successfully as {output_path}")
 
-        self.process_and_save_final_results("data/Combined_Results.csv", "data/Longest_Y_N.csv", "data/1166_Tagger_Results.csv")
+def _writePatternResults(df, path) -> None:
+    """
+    Writes the pattern detection results as `/` separated lines, the pattern and repetition left out for users without a pattern
+    """
+    with open(path, "w") as f:
+        f.write("Assignment_id/User_id/PD_result/Pattern/Repetition\n")
+        for assignment_id, user, result, pattern, count in df.itertuples(index=False):
+            if result == "Found":
+                f.write(f"{assignment_id}/{user}/Found/{pattern}/{count}\n")
+            else:
+                f.write(f"{assignment_id}/{user}/Not_found\n")
+
+
+def _normalized(values, maximum) -> pd.Series:
+    """
+    Divides the values by their maximum, all 0 if the maximum is 0
+    """
+    return values / maximum if maximum != 0 else pd.Series(0, index=values.index)
+
+
+def _lists(values, groups, num_groups) -> np.ndarray:
+    """
+    Gathers values into one list per group, keeping their order within a group
+
+    Args:
+        values (array): values to gather
+        groups (array): group of every value, in 0..num_groups - 1
+        num_groups (int): number of groups
+
+    Returns:
+        array: object array holding the list of values of every group
+    """
+    lists = np.empty(num_groups, dtype=object)
+    order = np.argsort(groups, kind="stable")
+    bounds = np.cumsum(np.bincount(groups, minlength=num_groups))
+    for group, (start, end) in enumerate(zip(np.r_[0, bounds[:-1]].tolist(), bounds.tolist())):
+        lists[group] = values[order[start:end]].tolist()
+    return lists
+
+
+def _rounded(df, columns=("Fast Tagging Log Values", "Fast Tagging Seconds", "Alpha Values"), decimals=3) -> pd.DataFrame:
+    """
+    Rounds the numbers of the given result columns for display, leaving the blanks of those columns as they are
+    """
+    return df.assign(**{column: df[column].map(lambda value: round(value, decimals) if isinstance(value, float) else value) for column in columns})
+
+
+def parseAssignmentIds(value) -> list[int]:
+    """
+    Parses a comma separated list of assignment ids and inclusive ranges, e.g. "1100-1200,1166"
+
+    Args:
+        value (str): assignment ids as given on the command line
+
+    Returns:
+        list[int]: sorted, de-duplicated assignment ids
+    """
+    assignment_ids = set()
+    for part in value.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            start, end = (int(bound) for bound in part.split("-", 1))
+            if start > end:
+                raise argparse.ArgumentTypeError(f"invalid assignment range '{part}'")
+            assignment_ids.update(range(start, end + 1))
+        else:
+            assignment_ids.add(int(part))
+    if not assignment_ids:
+        raise argparse.ArgumentTypeError("no assignment ids given")
+    return sorted(assignment_ids)
+
+
+def costChunks(costs, num_chunks) -> np.ndarray:
+    """
+    Splits consecutive units of work into at most num_chunks chunks of about the same estimated cost
+
+    Args:
+        costs (array): estimated cost of every unit
+        num_chunks (int): number of chunks wanted
+
+    Returns:
+        array: bounds of the chunks, chunk c holds the units bounds[c]:bounds[c + 1]
+    """
+    cumulative = np.cumsum(costs)
+    if not len(cumulative):
+        return np.zeros(1, dtype=np.int64)
+    targets = cumulative[-1] * np.arange(1, num_chunks) / num_chunks
+    return np.unique(np.concatenate(([0], np.searchsorted(cumulative, targets, side="right"), [len(cumulative)])))
+
+
+def runShard(assignment_id, args) -> str:
+    """
+    Runs every stage of the pipeline for a single assignment over its own database connection.
+    Executed inside a worker process, so each shard writes to its own partition, `data/assignment=<id>/`.
+
+    Args:
+        assignment_id (int): assignment processed by this shard
+        args (argparse.Namespace): parsed command line arguments
+
+    Returns:
+        str: path of the final results file of the shard
+    """
+    app = Application([assignment_id], partitionDir("data", assignment_id), args.batch_size, args.pool_size, args.export_answers,
+                      args.cache_dir, args.refresh, args.incremental, args.database, args.workers, not args.final_only,
+                      args.output_format)
+    try:
+        app.assignTaggerReliability(args.log_time_min, args.alpha_min, args.min_pattern_len, args.max_pattern_len, args.min_pattern_rep, args.min_run_len)
+        return app.combine_csv_results('Combined_Results.csv')
+    finally:
+        app._connector.close()
 
 
 if __name__ == "__main__":
@@ -723,9 +887,33 @@ if __name__ == "__main__":
     parser.add_argument('--min_pattern_len', type=int, default=10, help="Minimum value for pattern detection.")
     parser.add_argument('--max_pattern_len', type=int, default=50, help="Maximum value for pattern detection.")
     parser.add_argument('--min_pattern_rep', type=int, default=15, help="Minimum repetition value for pattern detection.")
+    parser.add_argument('--min_run_len', type=int, default=10, help="Minimum length of the runs of consecutive Ys and Ns.")
+    parser.add_argument('--batch_size', type=int, default=BATCH_SIZE, help="Number of rows streamed from the database per batch.")
+    parser.add_argument('--assignments', type=parseAssignmentIds, default=[1166], help="Assignment ids and ranges to process, e.g. 1100-1200,1166.")
+    parser.add_argument('--pool_size', type=int, default=POOL_SIZE, help="Number of pooled database connections per shard.")
+    parser.add_argument('--export_answers', action='store_true', help="Export the answers of every team to answers.csv.")
+    parser.add_argument('--cache_dir', type=str, default=os.path.join("data", "cache"), help="Directory of the local snapshot cache.")
+    parser.add_argument('--refresh', action='store_true', help="Ignore the local snapshot cache and fetch everything from the database.")
+    parser.add_argument('--incremental', action='store_true', help="Only recompute the users and teams touched by tags updated since the last run.")
+    parser.add_argument('--database', type=str, default=None, help="Offline SQLite database (e.g. from SyntheticData.py) used instead of MySQL.")
+    parser.add_argument('--shard_workers', type=int, default=os.cpu_count(), help="Number of assignments processed in parallel.")
+    parser.add_argument('--workers', type=int, default=1, help="Number of processes the pattern detection of every assignment is spread over.")
+    parser.add_argument('--output_format', choices=["csv", "parquet", "both"], default="csv",
+                        help="Write the results as CSV, as Parquet files with typed and list columns, or both.")
+    parser.add_argument('--final_only', action='store_true', help="Only write the final results file of every assignment, not the table of every stage.")
     args = parser.parse_args()
 
-    app = Application()
- 
-    app.assignTaggerReliability(args.log_time_min, args.alpha_min, args.min_pattern_len, args.max_pattern_len, args.min_pattern_rep)
-    app.combine_csv_results('Combined_Results.csv')
+    # Only shard the assignments that actually have tags
+    connector = MySQL(args.assignments, pool_size=1) if args.database is None else SQLiteDataSource(args.database, args.assignments, pool_size=1)
+    assignment_ids = connector.getTaggedAssignments(args.assignments)
+    connector.close()
+    print(f"Processing {len(assignment_ids)} tagged assignment(s) out of {len(args.assignments)} requested")
+
+    # Every assignment is fetched and processed as its own shard in a separate process
+    with ProcessPoolExecutor(max_workers=max(1, min(args.shard_workers, len(assignment_ids) or 1))) as executor:
+        futures = {executor.submit(runShard, assignment_id, args): assignment_id for assignment_id in assignment_ids}
+        for future in as_completed(futures):
+            print(f"Assignment {futures[future]} finished, results written to {future.result()}")
+
+    # The index at the root lists the manifest of every partition, so readers can load only the assignments they need
+    print(f"Manifest of {len(assignment_ids)} partition(s) written to {updateIndex('data', [partitionDir('data', assignment_id) for assignment_id in assignment_ids])}")
@@ -0,0 +1,80 @@
+from abc import ABC, abstractmethod
+
+
+class DataSource(ABC):
+    """
+    Interface of the sources the pipeline reads its tagging data from.
+    SQLDataSource implements it with the queries of the pipeline, run by MySQL against the live Expertiza database
+    and by SQLiteDataSource against an offline SQLite file.
+    """
+    assignment_ids = ()     # assignments whose tags are read from the source
+
+    @abstractmethod
+    def submit(self, method, *args, **kwargs):
+        """
+        Schedules a fetch method so it runs concurrently with the caller
+        Returns:
+            Future: future holding the result of the method
+        """
+
+    @abstractmethod
+    def close(self) -> None:
+        """
+        Releases the connections and threads held by the source
+        """
+
+    @abstractmethod
+    def getTaggedAssignments(self, assignment_ids) -> list[int]:
+        """
+        Returns:
+            list[int]: sorted ids of the given assignments that have at least one answer tag
+        """
+
+    @abstractmethod
+    def getWatermark(self) -> dict:
+        """
+        Returns:
+            dict: {assignment_id: (max(updated_at), number of tags)}
+        """
+
+    @abstractmethod
+    def iterTagRows(self, batch_size, updated_since=None):
+        """
+        Yields:
+            list[tuple]: batch of (id, assignment_id, answer_id, tag_prompt_deployment_id, user_id, value, created_at, updated_at, tag_prompt_id) rows
+        """
+
+    @abstractmethod
+    def getTeamMembers(self) -> list[tuple]:
+        """
+        Returns:
+            list[tuple]: (assignment_id, user_id, team_id) rows
+        """
+
+    @abstractmethod
+    def getAnswerTexts(self, answer_ids=None) -> dict:
+        """
+        Returns:
+            dict: {answer_id: (question_id, question, answer_score, comments)}
+        """
+
+    @abstractmethod
+    def getQuestions(self, question_ids) -> dict:
+        """
+        Returns:
+            dict: {question_id: text} of the given questions
+        """
+
+    @abstractmethod
+    def getTagPrompts(self) -> dict:
+        """
+        Returns:
+            dict: {tag_prompt_id: prompt}
+        """
+
+    @abstractmethod
+    def getAnswerCounts(self, team_ids, export_path=None) -> dict:
+        """
+        Returns:
+            dict: {team_id: number of answers the team received}
+        """
@@ -4,6 +4,9 @@ from datetime import datetime
 
 class AnswerTag:
     # This class represents an AnswerTag object, which stores information about a specific tag associated with an answer.
+    # Attributes are kept in slots rather than a __dict__, as the records are created for every tag
+    __slots__ = ("id", "assignment_id", "answer_id", "tag_prompt_deployment_id", "user_id", "value", "created_at", "updated_at", "tag_prompt_id")
+
     def __init__(self, id: int, assignment_id: int, answer_id: int, tag_prompt_deployment_id: int, user_id: int, 
                 value: str, created_at: datetime, updated_at: datetime, tag_prompt_id = None) -> None:
         self.id = id
@@ -0,0 +1,182 @@
+import numpy as np
+from Models.TagTable import TagTable
+
+class RaterMatrix:
+    """
+    Sparse item x rater matrix of the tags of every team, replacing the {assignment: {team: {user: {answer: {tag_prompt: tag}}}}} hierarchy.
+    Items are the (answer_id, tag_prompt_id) pairs tagged in a team and raters are its users. The matrix is stored as
+    COO entries (item, rater, value, row of the tags table) grouped by team, with per-team offsets into the entries,
+    the raters and the items, so the matrix of a team is a slice of the arrays.
+
+    Teams come in the order of their first tag within their assignment, and raters and items in the order of
+    their first tag within the team, as the hierarchy was filled. A user tagging the same item twice keeps the last tag.
+    """
+    def __init__(self) -> None:
+        self.assignment_ids = np.empty(0, dtype=np.int32)   # assignment of every team
+        self.team_ids = np.empty(0, dtype=np.int32)         # id of every team
+        self.offsets = np.zeros(1, dtype=np.int64)          # entries of team t are entries[offsets[t]:offsets[t + 1]]
+        self.rater_offsets = np.zeros(1, dtype=np.int64)    # raters of team t are user_ids[rater_offsets[t]:rater_offsets[t + 1]]
+        self.item_offsets = np.zeros(1, dtype=np.int64)     # items of team t are item_*_ids[item_offsets[t]:item_offsets[t + 1]]
+        self.user_ids = np.empty(0, dtype=np.int32)         # user id of every rater
+        self.item_answer_ids = np.empty(0, dtype=np.int32)  # answer id of every item
+        self.item_prompt_ids = np.empty(0, dtype=np.int32)  # tag prompt id of every item
+        self.items = np.empty(0, dtype=np.int32)            # item of every entry, numbered within its team
+        self.raters = np.empty(0, dtype=np.int32)           # rater of every entry, numbered within its team
+        self.values = np.empty(0, dtype=np.int8)            # tag value of every entry
+        self.rows = np.empty(0, dtype=np.int64)             # row of the tags table every entry comes from
+
+    @classmethod
+    def build(cls, tags, team_members):
+        """
+        Builds the matrix of every team in a single pass over the tag rows
+        Args:
+            tags (TagTable): tags of the assignments
+            team_members (list[tuple]): (assignment_id, user_id, team_id) membership rows
+        Returns:
+            RaterMatrix: the matrix of every team
+        """
+        matrix = cls()
+        if not len(tags) or not team_members:
+            return matrix
+
+        # Join every tag with the teams of its user, tags of users in several teams go to each of them in membership order
+        members = np.array(team_members, dtype=np.int64).reshape(-1, 3)
+        member_keys = _pairKeys(members[:, 0], members[:, 1])
+        member_order = np.argsort(member_keys, kind="stable")
+        member_keys, member_teams = member_keys[member_order], members[member_order, 2]
+        tag_keys = _pairKeys(tags.assignment_id, tags.user_id)
+        first = np.searchsorted(member_keys, tag_keys, side="left")
+        counts = np.searchsorted(member_keys, tag_keys, side="right") - first
+        rows = np.repeat(np.arange(len(tags)), counts)
+        if not len(rows):
+            return matrix
+        teams = member_teams[np.repeat(first - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())]
+        assignments, users = tags.assignment_id[rows], tags.user_id[rows]
+        answers, prompts = tags.answer_id[rows], tags.tag_prompt_id[rows]
+        positions = np.arange(len(rows))
+
+        # One entry per (team, user, item), holding the last tag at the position of the first one
+        groups, group_first = _firstCodes(positions, assignments, teams, users, answers, prompts)
+        last = np.zeros(len(group_first), dtype=np.int64)
+        np.maximum.at(last, groups, positions)
+        entries = np.argsort(group_first, kind="stable")
+        first_positions, rows = group_first[entries], rows[last[entries]]
+        assignments, teams, users = tags.assignment_id[rows], teams[last[entries]], tags.user_id[rows]
+        answers, prompts = tags.answer_id[rows], tags.tag_prompt_id[rows]
+
+        # Teams in order of first appearance within assignments in order of first appearance
+        assignment_codes, assignment_first = _firstCodes(first_positions, assignments)
+        team_codes, team_first = _firstCodes(first_positions, assignments, teams)
+        team_rank = np.lexsort((team_first, assignment_first[_representatives(assignment_codes, team_codes)]))
+        team_index = np.empty_like(team_rank)
+        team_index[team_rank] = np.arange(len(team_rank))
+        entry_teams = team_index[team_codes]
+
+        # Raters and items numbered within their team in order of first appearance
+        rater_codes, rater_first = _firstCodes(first_positions, entry_teams, users)
+        item_codes, item_first = _firstCodes(first_positions, entry_teams, answers, prompts)
+        raters, rater_order, rater_counts = _localCodes(rater_codes, rater_first, entry_teams, len(team_rank))
+        items, item_order, item_counts = _localCodes(item_codes, item_first, entry_teams, len(team_rank))
+
+        order = np.lexsort((items, raters, entry_teams))
+        matrix.offsets = np.concatenate(([0], np.cumsum(np.bincount(entry_teams, minlength=len(team_rank)))))
+        matrix.rater_offsets = np.concatenate(([0], np.cumsum(rater_counts)))
+        matrix.item_offsets = np.concatenate(([0], np.cumsum(item_counts)))
+        team_entry = np.empty(len(team_rank), dtype=np.int64)
+        team_entry[entry_teams[::-1]] = np.arange(len(entry_teams))[::-1]
+        matrix.assignment_ids = assignments[team_entry].astype(np.int32)
+        matrix.team_ids = teams[team_entry].astype(np.int32)
+        matrix.user_ids = _representatives(users, rater_codes)[rater_order].astype(np.int32)
+        matrix.item_answer_ids = _representatives(answers, item_codes)[item_order].astype(np.int32)
+        matrix.item_prompt_ids = _representatives(prompts, item_codes)[item_order].astype(np.int32)
+        matrix.items = items[order].astype(np.int32)
+        matrix.raters = raters[order].astype(np.int32)
+        matrix.values = tags.value[rows[order]]
+        matrix.rows = rows[order]
+        return matrix
+
+    def __len__(self) -> int:
+        return len(self.team_ids)
+
+    def shape(self, team) -> tuple:
+        """
+        Returns:
+            tuple: (number of items, number of raters) of the team at the given index
+        """
+        return (int(self.item_offsets[team + 1] - self.item_offsets[team]), int(self.rater_offsets[team + 1] - self.rater_offsets[team]))
+
+    def users(self, team) -> np.ndarray:
+        """
+        Returns:
+            array: user id of every rater of the team at the given index
+        """
+        return self.user_ids[self.rater_offsets[team]:self.rater_offsets[team + 1]]
+
+    def entries(self, team) -> tuple:
+        """
+        Returns:
+            tuple: (items, raters, values, rows) arrays of the entries of the team at the given index, sorted by rater and item
+        """
+        entries = slice(self.offsets[team], self.offsets[team + 1])
+        return self.items[entries], self.raters[entries], self.values[entries], self.rows[entries]
+
+    def dense(self, team) -> np.ndarray:
+        """
+        Returns:
+            array: item x rater matrix of the tag values of the team at the given index, nan where a rater did not tag an item,
+                   the input of TaggerClassifier.computeKrippendorffAlpha
+        """
+        items, raters, values, _ = self.entries(team)
+        data = np.full(self.shape(team), np.nan)
+        data[items, raters] = np.where(values == TagTable.MISSING, np.nan, values)
+        return data
+
+
+def _pairKeys(first, second) -> np.ndarray:
+    """
+    Combines two int32 columns into one int64 key
+    """
+    return (np.asarray(first, dtype=np.int64) << 32) | (np.asarray(second, dtype=np.int64) & 0xFFFFFFFF)
+
+
+def _firstCodes(positions, *keys) -> tuple:
+    """
+    Numbers the distinct combinations of the key columns
+    Returns:
+        tuple: code of every row, and the smallest position of the rows of every code
+    """
+    order = np.lexsort(keys[::-1])
+    new_code = np.zeros(len(order), dtype=bool)
+    new_code[:1] = True
+    for key in keys:
+        sorted_key = key[order]
+        new_code[1:] |= sorted_key[1:] != sorted_key[:-1]
+    codes = np.empty(len(order), dtype=np.int64)
+    codes[order] = np.cumsum(new_code) - 1
+    first = np.full(int(new_code.sum()), np.iinfo(np.int64).max, dtype=np.int64)
+    np.minimum.at(first, codes, positions)
+    return codes, first
+
+
+def _localCodes(codes, first, groups, num_groups) -> tuple:
+    """
+    Renumbers codes within their group in order of first appearance
+    Returns:
+        tuple: local code of every row, the codes ordered by group and local code, and the number of codes of every group
+    """
+    code_groups = np.empty(len(first), dtype=np.int64)
+    code_groups[codes] = groups
+    code_order = np.lexsort((first, code_groups))
+    counts = np.bincount(code_groups, minlength=num_groups)
+    local = np.empty(len(first), dtype=np.int64)
+    local[code_order] = np.arange(len(first)) - np.repeat(np.concatenate(([0], np.cumsum(counts)[:-1])), counts)
+    return local[codes], code_order, counts
+
+
+def _representatives(values, codes) -> np.ndarray:
+    """
+    Returns the value of every code, taken from any of its rows
+    """
+    representatives = np.empty(codes.max() + 1 if len(codes) else 0, dtype=values.dtype)
+    representatives[codes] = values
+    return representatives
@@ -0,0 +1,208 @@
+import numpy as np
+from Models.AnswerTag import AnswerTag
+
+class TagTable:
+    """
+    Struct-of-arrays table of answer tags, one NumPy array per column, replacing a list of AnswerTag objects.
+    IDs are stored as int32, tag values as int8 and timestamps as int64 microseconds since the epoch.
+    Slices share the arrays of the table they are taken from, AnswerTag records are built only on request.
+    """
+    COLUMNS = ("id", "assignment_id", "answer_id", "tag_prompt_deployment_id", "user_id", "value", "created_at", "updated_at", "tag_prompt_id")
+    ID_COLUMNS = ("id", "assignment_id", "answer_id", "tag_prompt_deployment_id", "user_id", "tag_prompt_id")
+    TIME_COLUMNS = ("created_at", "updated_at")
+    NULL_ID = -1                                # stored for NULL ids
+    MISSING = -128                              # stored for NULL or non-numeric tag values
+    NULL_TIME = np.iinfo(np.int64).min          # stored for NULL timestamps, the int64 view of NaT
+    DTYPES = {column: np.int32 for column in ID_COLUMNS}
+    DTYPES.update({"value": np.int8, "created_at": np.int64, "updated_at": np.int64})
+
+    __slots__ = COLUMNS
+
+    def __init__(self, columns=None) -> None:
+        columns = columns or {}
+        for column in self.COLUMNS:
+            setattr(self, column, columns[column] if column in columns else np.empty(0, dtype=self.DTYPES[column]))
+
+    @classmethod
+    def fromRows(cls, rows):
+        """
+        Encodes tag rows as returned by the database
+        Args:
+            rows (list[tuple]): rows ordered as COLUMNS, values as strings and timestamps as datetimes
+        Returns:
+            TagTable: table holding the rows
+        """
+        if not rows:
+            return cls()
+        return cls({column: encodeColumn(column, values) for column, values in zip(cls.COLUMNS, zip(*rows))})
+
+    @classmethod
+    def concat(cls, tables):
+        """
+        Concatenates tables into a new one
+        """
+        tables = [table for table in tables if len(table)]
+        if len(tables) == 1:
+            return tables[0]
+        return cls({column: np.concatenate([getattr(table, column) for table in tables]) for column in cls.COLUMNS}) if tables else cls()
+
+    def __len__(self) -> int:
+        return len(self.id)
+
+    def __getitem__(self, index):
+        """
+        Returns the rows selected by a slice as a view sharing the arrays of this table, or by an index array or mask as a copy
+        """
+        if isinstance(index, (int, np.integer)):
+            return self.record(index)
+        return TagTable({column: getattr(self, column)[index] for column in self.COLUMNS})
+
+    def columns(self) -> dict:
+        """
+        Returns:
+            dict: {column: array} of the table
+        """
+        return {column: getattr(self, column) for column in self.COLUMNS}
+
+    def sortedBy(self, *columns):
+        """
+        Sorts the rows by the given columns, keeping the order of equal rows like list.sort
+        Returns:
+            TagTable: sorted copy of the table
+        """
+        if len(columns) == 1:
+            order = np.argsort(getattr(self, columns[0]), kind="stable")
+        else:
+            order = np.lexsort([getattr(self, column) for column in reversed(columns)])
+        return self[order]
+
+    def groupBy(self, *columns) -> list:
+        """
+        Groups the rows by the given columns. Groups come in the order of their first row, like a dict filled
+        row by row, and rows keep their order within a group. The rows are reordered once and every group is
+        a view on the reordered table.
+        Returns:
+            list[tuple]: (key, TagTable) pairs, the key is a tuple of ints, or an int when grouping by one column
+        """
+        if not len(self):
+            return []
+        keys = [getattr(self, column) for column in columns]
+        order = np.lexsort(keys[::-1])
+        sorted_keys = [key[order] for key in keys]
+        new_group = np.zeros(len(order), dtype=bool)
+        new_group[0] = True
+        for key in sorted_keys:
+            new_group[1:] |= key[1:] != key[:-1]
+        starts = np.flatnonzero(new_group)
+        counts = np.diff(np.append(starts, len(order)))
+
+        # Order the groups by their first row
+        group_order = np.argsort(np.minimum.reduceat(order, starts), kind="stable")
+        starts, counts = starts[group_order], counts[group_order]
+        offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        grouped = self[order[np.repeat(starts - offsets, counts) + np.arange(len(order))]]
+
+        groups = []
+        for start, offset, count in zip(starts.tolist(), offsets.tolist(), counts.tolist()):
+            key = tuple(int(key[start]) for key in sorted_keys)
+            groups.append((key if len(columns) > 1 else key[0], grouped[offset:offset + count]))
+        return groups
+
+    def row(self, index) -> tuple:
+        """
+        Returns the encoded values of a row, ordered as COLUMNS
+        """
+        return tuple(getattr(self, column)[index].item() for column in self.COLUMNS)
+
+    def setRow(self, index, encoded_row) -> None:
+        """
+        Overwrites a row with encoded values, as returned by row or encodeRow
+        """
+        for column, value in zip(self.COLUMNS, encoded_row):
+            getattr(self, column)[index] = value
+
+    def record(self, index) -> AnswerTag:
+        """
+        Returns:
+            AnswerTag: the row at the index as a record
+        """
+        return AnswerTag(*(values[0] for values in self._decoded(slice(index, index + 1 or None))))
+
+    def valueLabels(self) -> list:
+        """
+        Returns:
+            list: tag values as the strings stored in the database ('1', '-1', '0'), None if missing
+        """
+        return decodeValues(self.value)
+
+    def seconds(self, column="created_at") -> np.ndarray:
+        """
+        Returns:
+            array: timestamps of the column as float seconds since the epoch
+        """
+        return getattr(self, column) / 1e6
+
+    def _decoded(self, index) -> list[list]:
+        """
+        Decodes the rows selected by the index back to Python values, column by column
+        """
+        decoded = []
+        for column in self.COLUMNS:
+            values = getattr(self, column)[index]
+            if column == "value":
+                decoded.append(decodeValues(values))
+            elif column in self.TIME_COLUMNS:
+                decoded.append(values.view("datetime64[us]").tolist())
+            else:
+                decoded.append([None if value == self.NULL_ID else value for value in values.tolist()])
+        return decoded
+
+
+_VALUE_CODES = {"1": 1, "-1": -1, "0": 0}
+_VALUE_LABELS = {code: label for label, code in _VALUE_CODES.items()}
+
+
+def encodeValue(value) -> int:
+    """
+    Encodes a tag value stored as a string as an int8 code
+    """
+    if value in _VALUE_CODES:
+        return _VALUE_CODES[value]
+    try:
+        code = int(value)
+    except (TypeError, ValueError):
+        return TagTable.MISSING
+    return code if -128 < code < 128 else TagTable.MISSING
+
+
+def decodeValues(values) -> list:
+    """
+    Decodes int8 value codes back to the strings stored in the database, None for missing values
+    """
+    return [None if value == TagTable.MISSING else _VALUE_LABELS.get(value, str(value)) for value in values.tolist()]
+
+
+def encodeColumn(column, values) -> np.ndarray:
+    """
+    Encodes the Python values of a column of tag rows as a typed array
+    Args:
+        column (str): name of the column, one of TagTable.COLUMNS
+        values (iterable): values of the column, None for NULL
+    Returns:
+        array: the encoded column
+    """
+    if column == "value":
+        return np.array([encodeValue(value) for value in values], dtype=np.int8)
+    if column in TagTable.TIME_COLUMNS:
+        return np.array(values, dtype="datetime64[us]").view(np.int64)
+    array = np.array([TagTable.NULL_ID if value is None else value for value in values], dtype=np.int64)
+    if array.size and (array.max() > np.iinfo(np.int32).max or array.min() < np.iinfo(np.int32).min):
+        raise OverflowError(f"{column} does not fit in 32 bits")
+    return array.astype(np.int32)
+
+
+def encodeRow(row) -> tuple:
+    """
+    Encodes a tag row as returned by the database, as returned by TagTable.row
+    """
+    return tuple(encodeColumn(column, [value])[0].item() for column, value in zip(TagTable.COLUMNS, row))
@@ -0,0 +1,135 @@
+import hashlib
+import json
+import os
+import pandas as pd
+
+MANIFEST = "manifest.json"      # name of the manifest of a partition, and of the index of all partitions at the output root
+
+
+def partitionDir(root, assignment_id) -> str:
+    """
+    Returns the directory the outputs of an assignment are written to, data/assignment=<id>
+    """
+    return os.path.join(root, f"assignment={assignment_id}")
+
+
+def fileEntry(path, rows) -> dict:
+    """
+    Describes an output file for the manifest
+    Args:
+        path (str): path of the written file
+        rows (int): number of rows of the table written to it
+    Returns:
+        dict: file name, row count, size in bytes and SHA-256 checksum of the file
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return {"file": os.path.basename(path), "rows": int(rows), "bytes": os.path.getsize(path), "sha256": digest.hexdigest()}
+
+
+def readManifest(directory) -> dict:
+    """
+    Reads the manifest of a partition, or the index at the output root
+    Returns:
+        dict: the manifest, empty if there is none
+    """
+    path = os.path.join(directory, MANIFEST)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def writeManifest(directory, manifest) -> str:
+    """
+    Writes the manifest of a partition, replacing the previous one at once so readers never see a partial file
+    Args:
+        directory (str): partition directory
+        manifest (dict): {"assignment_ids": [...], "parameters": {...}, "files": [fileEntry, ...]}
+    Returns:
+        str: path of the manifest
+    """
+    path = os.path.join(directory, MANIFEST)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2, default=str)
+    os.replace(path + ".tmp", path)
+    return path
+
+
+def removeStale(directory, previous, files) -> list:
+    """
+    Deletes the files a previous manifest of a partition listed that its new manifest does not, e.g. the stage tables
+    of an earlier full run once a --final_only run replaced it, so the partition only holds the files of its manifest.
+    Files the pipeline never listed are left alone.
+    Args:
+        directory (str): partition directory
+        previous (dict): manifest the partition had before this run, as returned by readManifest
+        files (list): fileEntry of every file of the new manifest
+    Returns:
+        list: names of the deleted files
+    """
+    listed = {entry["file"] for entry in files}
+    stale = [entry["file"] for entry in previous.get("files", []) if entry["file"] not in listed]
+    for file_name in stale:
+        path = os.path.join(directory, file_name)
+        if os.path.exists(path):
+            os.remove(path)
+    return stale
+
+
+def updateIndex(root, directories) -> str:
+    """
+    Adds the manifests of the given partitions to the index at the output root, keeping the partitions of earlier runs
+    Args:
+        root (str): output root directory
+        directories (iterable): partition directories written by this run
+    Returns:
+        str: path of the index
+    """
+    index = readManifest(root) or {"partitions": {}}
+    for directory in directories:
+        manifest = readManifest(directory)
+        if manifest:
+            index["partitions"][os.path.relpath(directory, root)] = manifest
+    index["partitions"] = dict(sorted(index["partitions"].items()))
+    return writeManifest(root, index)
+
+
+def loadTable(root, table, assignment_ids=None, verify=False) -> pd.DataFrame:
+    """
+    Loads a table from the partitions listed in the index at the output root, reading only the partitions of the
+    given assignments. The Parquet file of a table is read when it was written, keeping its types and list columns,
+    otherwise its CSV or text view.
+
+    Args:
+        root (str): output root directory
+        table (str): file name of the table without extension, where {assignment_id} stands for the assignment
+                     of the partition, e.g. "Combined_Results" or "{assignment_id}_Tagger_Results"
+        assignment_ids (iterable, optional): assignments to load, defaults to every partition
+        verify (bool): check the files against the checksums of the manifest
+
+    Returns:
+        DataFrame: rows of the table of every partition loaded, one after the other
+    """
+    wanted = None if assignment_ids is None else set(assignment_ids)
+    frames = []
+    for partition, manifest in readManifest(root).get("partitions", {}).items():
+        partition_ids = manifest["assignment_ids"]
+        if wanted is not None and not wanted.intersection(partition_ids):
+            continue
+        stem = table.format(assignment_id="-".join(str(assignment_id) for assignment_id in partition_ids))
+        entries = {entry["file"]: entry for entry in manifest["files"]}
+        file_name = next((stem + extension for extension in (".parquet", ".csv", ".txt") if stem + extension in entries), None)
+        if file_name is None:
+            raise KeyError(f"{table} is not in partition {partition}")
+
+        path = os.path.join(root, partition, file_name)
+        if verify and fileEntry(path, entries[file_name]["rows"]) != entries[file_name]:
+            raise ValueError(f"{path} does not match its manifest")
+        if file_name.endswith(".parquet"):
+            frames.append(pd.read_parquet(path))
+        else:
+            frames.append(pd.read_csv(path, sep="/" if file_name.endswith(".txt") else ","))
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
@@ -1,130 +1,273 @@
-class PatternDetection:
-    # Main Class for Pattern Recognition
-    class PlaceHolderNode:
-        # Sub class used for custom data structure
-        def __init__(self):
-            self.LP = -float("inf")
-            self.SP = -float("inf")
-        
-    def CheckPattern(self,lptr, rptr, period, bin_data,min_tags):
-        """
-        Function used to check whether there exist a pattern of appropriate length within the given interval
-
-        Arguments:
-        lptr -- the starting index for the search
-        rptr -- the ending index for the search
-        period -- the length of the pattern to search for
-        bin_data -- the data to search within
-
-        Return:
-        Result -- a list containing a boolean for pattern found, pattern,and repitition
-        """
-        result = 3*[False]
-        pattern_list = []
-
-        # Loop through the range of positions for the given period and check for patterns
-        for i in range(lptr, rptr + 1, period):
-            pattern = bin_data[i: i + period]
-
-            # If pattern is of the given period length, add it to the pattern_list
-            if len(pattern ) == period:
-                pattern_list.append(tuple(pattern ))
-
-                # If the pattern has occurred minimum number of times, and all the occurrences are same, print the pattern
-        if (len(pattern_list)>1 and len(pattern_list)*len(pattern_list[0]) >= min_tags):
-            if len(set(pattern_list)) == 1:
-                result[0] = pattern_list[0]
-                result[1] = len(pattern_list)
-                result[2] = True
-        return result
-
-
-    def PeriodicityCheck(self,bin_data, period, min_tags):
-        """
-        Perform periodicity check and validation on the binary data for a given period
-
-        Arguments:
-        bin_data -- the data to search within
-        period -- the length of the pattern to search for
-        min_rep -- the minimum number of repetitions of the pattern required to declare a match
-
-        Return:
-        Result -- a list containing a boolean for pattern found, pattern,and repitition
-        """
-        result = 3*[False]
-        # Create a list of PlaceholderNodes for each position in the period
-        PlaceHolder = [self.PlaceHolderNode() for _ in range(period)]
-        # Initialize the LP (last position) and SP (start position) of each PlaceholderNode
-        for i in range(period):
-            PlaceHolder[i].LP = i % period
-            PlaceHolder[i].SP = i % period
-        valid = False
-        pos = (len(bin_data) - 1 ) % period
-        # Iterate through the data starting from the end of the period
-        for i in range(period, len(bin_data)):
-            pos = i % period
-            # If the current element matches with the LP of the corresponding placeholder node, update the LP
-            if (bin_data[PlaceHolder[pos].LP] == bin_data[i]):
-                PlaceHolder[pos].LP = i
-                continue
-            else:
-                # If there is a pattern in the range between SP and LP, consider it as a valid pattern
-                result = self.CheckPattern(PlaceHolder[pos].SP, PlaceHolder[pos].LP, period, bin_data,min_tags)
-                if result[2]:
-                    return result
-                    # continue
-                
-                # Otherwise, update the SP and LP for the corresponding placeholder node
-                PlaceHolder[pos].SP = i
-                PlaceHolder[pos].LP = i
-        # Check if a pattern is found between the start and last positions for the last position in the period
-        result = self.CheckPattern(PlaceHolder[pos].SP, PlaceHolder[pos].LP, period, bin_data,min_tags)
-        if result[2]:
-            return result
-        return result
-
-
-    def PTV(self, tags, Lmin, Lmax, min_tags):
-        tags.sort(key=lambda l: l.created_at)
-        bin_data = [i.value for i in tags]
-
-        patterns_found = []
-        for period in range(Lmin, Lmax + 1):
-            pattern_results = self.PeriodicityCheckAllPatterns(bin_data, period, min_tags)
-            for pattern, count in pattern_results:
-                if not any(set(pattern).issubset(set(p[0])) for p in patterns_found):
-                    patterns_found.append((pattern, count))
-
-        if not patterns_found:
-            return [("Not_found", 0)]
-        else:
-            return patterns_found
-
-    def PeriodicityCheckAllPatterns(self, bin_data, period, min_tags):
-        PlaceHolder = [self.PlaceHolderNode() for _ in range(period)]
-        for i in range(period):
-            PlaceHolder[i].LP = i % period
-            PlaceHolder[i].SP = i % period
-
-        patterns = []
-        for i in range(period, len(bin_data)):
-            pos = i % period
-            if bin_data[PlaceHolder[pos].LP] == bin_data[i]:
-                PlaceHolder[pos].LP = i
-                continue
-            else:
-                result = self.CheckPattern(PlaceHolder[pos].SP, PlaceHolder[pos].LP, period, bin_data, min_tags)
-                if result[2]:
-                    if result[0] not in (p[0] for p in patterns):
-                        patterns.append((result[0], result[1]))
-                
-                PlaceHolder[pos].SP = i
-                PlaceHolder[pos].LP = i
-
-        pos = (len(bin_data) - 1) % period
-        result = self.CheckPattern(PlaceHolder[pos].SP, PlaceHolder[pos].LP, period, bin_data, min_tags)
-        if result[2]:
-            if result[0] not in (p[0] for p in patterns):
-                patterns.append((result[0], result[1]))
-
-        return patterns
\ No newline at end of file
+import numpy as np
+from Models.TagTable import TagTable, decodeValues
+
+class PatternDetection:
+    # Main Class for Pattern Recognition
+    class PlaceHolderNode:
+        # Sub class used for custom data structure
+        def __init__(self):
+            self.LP = -float("inf")
+            self.SP = -float("inf")
+        
+    def CheckPattern(self,lptr, rptr, period, bin_data,min_tags):
+        """
+        Function used to check whether there exist a pattern of appropriate length within the given interval
+
+        Arguments:
+        lptr -- the starting index for the search
+        rptr -- the ending index for the search
+        period -- the length of the pattern to search for
+        bin_data -- the data to search within
+
+        Return:
+        Result -- a list containing a boolean for pattern found, pattern,and repitition
+        """
+        result = 3*[False]
+        pattern_list = []
+
+        # Loop through the range of positions for the given period and check for patterns
+        for i in range(lptr, rptr + 1, period):
+            pattern = bin_data[i: i + period]
+
+            # If pattern is of the given period length, add it to the pattern_list
+            if len(pattern ) == period:
+                pattern_list.append(tuple(pattern ))
+
+                # If the pattern has occurred minimum number of times, and all the occurrences are same, print the pattern
+        if (len(pattern_list)>1 and len(pattern_list)*len(pattern_list[0]) >= min_tags):
+            if len(set(pattern_list)) == 1:
+                result[0] = pattern_list[0]
+                result[1] = len(pattern_list)
+                result[2] = True
+        return result
+
+
+    def PeriodicityCheck(self,bin_data, period, min_tags):
+        """
+        Perform periodicity check and validation on the binary data for a given period
+
+        Arguments:
+        bin_data -- the data to search within
+        period -- the length of the pattern to search for
+        min_rep -- the minimum number of repetitions of the pattern required to declare a match
+
+        Return:
+        Result -- a list containing a boolean for pattern found, pattern,and repitition
+        """
+        result = 3*[False]
+        # Create a list of PlaceholderNodes for each position in the period
+        PlaceHolder = [self.PlaceHolderNode() for _ in range(period)]
+        # Initialize the LP (last position) and SP (start position) of each PlaceholderNode
+        for i in range(period):
+            PlaceHolder[i].LP = i % period
+            PlaceHolder[i].SP = i % period
+        valid = False
+        pos = (len(bin_data) - 1 ) % period
+        # Iterate through the data starting from the end of the period
+        for i in range(period, len(bin_data)):
+            pos = i % period
+            # If the current element matches with the LP of the corresponding placeholder node, update the LP
+            if (bin_data[PlaceHolder[pos].LP] == bin_data[i]):
+                PlaceHolder[pos].LP = i
+                continue
+            else:
+                # If there is a pattern in the range between SP and LP, consider it as a valid pattern
+                result = self.CheckPattern(PlaceHolder[pos].SP, PlaceHolder[pos].LP, period, bin_data,min_tags)
+                if result[2]:
+                    return result
+                    # continue
+                
+                # Otherwise, update the SP and LP for the corresponding placeholder node
+                PlaceHolder[pos].SP = i
+                PlaceHolder[pos].LP = i
+        # Check if a pattern is found between the start and last positions for the last position in the period
+        result = self.CheckPattern(PlaceHolder[pos].SP, PlaceHolder[pos].LP, period, bin_data,min_tags)
+        if result[2]:
+            return result
+        return result
+
+
+    def PTV(self, tags, Lmin, Lmax, min_tags):
+        # tags is a list of answer tags or a TagTable, either way checked in the order they were created
+        if isinstance(tags, TagTable):
+            tags = tags.sortedBy("created_at")
+            bin_data = tags.valueLabels()
+            codes = tags.value
+        else:
+            tags.sort(key=lambda l: l.created_at)
+            bin_data = [i.value for i in tags]
+            labels = {}
+            codes = np.array([labels.setdefault(value, len(labels)) for value in bin_data], dtype=np.int64)
+        return self.SequencePatterns(codes, bin_data, Lmin, Lmax, min_tags)
+
+    def SequencePatterns(self, codes, bin_data, Lmin, Lmax, min_tags):
+        """
+        Pattern detection of PTV on a sequence of values already in the order they were created
+
+        Arguments:
+        codes -- integer array of the sequence, equal values having equal codes
+        bin_data -- the values of the sequence
+
+        Return:
+        list of (pattern, repetition) pairs, [("Not_found", 0)] if there is none
+        """
+        # A pattern made of every value of the sequence is a superset of any pattern found after it
+        all_values = set(bin_data)
+        patterns_found = []
+        for pattern, count in self.PeriodicPatterns(codes, bin_data, Lmin, Lmax, min_tags):
+            if not any(set(pattern).issubset(set(p[0])) for p in patterns_found):
+                patterns_found.append((pattern, count))
+                if set(pattern) == all_values:
+                    break
+
+        if not patterns_found:
+            return [("Not_found", 0)]
+        else:
+            return patterns_found
+
+    def PeriodicPatterns(self, codes, bin_data, Lmin, Lmax, min_tags):
+        """
+        Finds the patterns of every period from Lmin to Lmax, as PeriodicityCheckAllPatterns does, on the integer codes of the
+        sequence. PeriodicityCheckAllPatterns compares every value with the one a period before it, and checks the run of
+        a position class up to a mismatch: it holds a pattern when no other mismatch falls within its repetitions after
+        the first one. The mismatches of a period are found with one comparison of the shifted sequence, so only the
+        runs ending at them are looked at.
+
+        Arguments:
+        codes -- integer array of the sequence, equal values having equal codes
+        bin_data -- the values of the sequence, the patterns are taken from
+        Lmin, Lmax -- the range of periods to search for
+        min_tags -- the minimum number of tags covered by a pattern
+
+        Yields:
+        (pattern, repetition) pairs, period by period, in the order PeriodicityCheckAllPatterns returns them
+        """
+        n = len(codes)
+        if n < min_tags:
+            return
+        # A pattern repeats at least twice, so periods longer than half the sequence find nothing
+        for period in range(max(Lmin, 1), min(Lmax, n // 2) + 1):
+            mismatches = np.flatnonzero(codes[period:] != codes[:-period]) + period
+            residues = mismatches % period
+
+            # Start of the run ending at every mismatch: the previous mismatch of the same position class, or its first position
+            order = np.argsort(residues, kind="stable")
+            first = np.ones(len(order), dtype=bool)
+            first[1:] = residues[order][1:] != residues[order][:-1]
+            starts = np.empty(len(mismatches), dtype=np.int64)
+            starts[order] = np.where(first, residues[order], np.roll(mismatches[order], 1))
+
+            # The run is a pattern if no mismatch falls after its first repetition
+            previous = np.concatenate(([-1], mismatches[:-1]))
+            lengths = mismatches - starts
+            found = (previous < starts + period) & (lengths >= 2 * period) & (lengths >= min_tags)
+            ends = list(zip(starts[found].tolist(), (lengths[found] // period).tolist()))
+
+            # The run of the class of the last position, cut at the last full repetition
+            last = (n - 1) % period
+            class_mismatches = mismatches[residues == last]
+            start = class_mismatches[-1].item() if len(class_mismatches) else last
+            repetitions = (n - start) // period
+            next_mismatch = np.searchsorted(mismatches, start + period)
+            if (next_mismatch == len(mismatches) or mismatches[next_mismatch] >= start + repetitions * period) \
+                    and repetitions > 1 and repetitions * period >= min_tags:
+                ends.append((start, repetitions))
+
+            patterns = []
+            for start, repetitions in ends:
+                pattern = tuple(bin_data[start:start + period])
+                if pattern not in (p[0] for p in patterns):
+                    patterns.append((pattern, repetitions))
+            yield from patterns
+
+    def PeriodicityCheckAllPatterns(self, bin_data, period, min_tags):
+        PlaceHolder = [self.PlaceHolderNode() for _ in range(period)]
+        for i in range(period):
+            PlaceHolder[i].LP = i % period
+            PlaceHolder[i].SP = i % period
+
+        patterns = []
+        for i in range(period, len(bin_data)):
+            pos = i % period
+            if bin_data[PlaceHolder[pos].LP] == bin_data[i]:
+                PlaceHolder[pos].LP = i
+                continue
+            else:
+                result = self.CheckPattern(PlaceHolder[pos].SP, PlaceHolder[pos].LP, period, bin_data, min_tags)
+                if result[2]:
+                    if result[0] not in (p[0] for p in patterns):
+                        patterns.append((result[0], result[1]))
+                
+                PlaceHolder[pos].SP = i
+                PlaceHolder[pos].LP = i
+
+        pos = (len(bin_data) - 1) % period
+        result = self.CheckPattern(PlaceHolder[pos].SP, PlaceHolder[pos].LP, period, bin_data, min_tags)
+        if result[2]:
+            if result[0] not in (p[0] for p in patterns):
+                patterns.append((result[0], result[1]))
+
+        return patterns
+
+    def RunLengths(self, values, lengths):
+        """
+        Run-length encodes several sequences at once
+
+        Arguments:
+        values -- integer array of the sequences one after another
+        lengths -- length of every sequence
+
+        Return:
+        (sequence, value, start, length) arrays of every run of equal values, a run never crossing into the next sequence
+        and its start counted from the beginning of its sequence
+        """
+        if not len(values):
+            return tuple(np.empty(0, dtype=np.int64) for _ in range(4))
+        lengths = np.asarray(lengths, dtype=np.int64)
+        sequence_starts = np.cumsum(lengths) - lengths
+        new_run = np.ones(len(values), dtype=bool)
+        new_run[1:] = values[1:] != values[:-1]
+        new_run[sequence_starts[lengths > 0]] = True
+        starts = np.flatnonzero(new_run)
+        sequences = np.repeat(np.arange(len(lengths)), lengths)[starts]
+        return sequences, values[starts], starts - sequence_starts[sequences], np.diff(np.append(starts, len(values)))
+
+    def LongRuns(self, values, lengths, min_lengths):
+        """
+        Finds the runs of given values that are at least a given length long, in several sequences at once
+
+        Arguments:
+        values -- integer array of the sequences one after another
+        lengths -- length of every sequence
+        min_lengths -- {value: minimum length of its runs}
+
+        Return:
+        {value: [lengths of the long runs of the value in the first sequence, in the second sequence, ...]}
+        """
+        sequences, run_values, _, run_lengths = self.RunLengths(values, lengths)
+        long_runs = {}
+        for value, min_length in min_lengths.items():
+            found = (run_values == value) & (run_lengths >= min_length)
+            counts = np.bincount(sequences[found], minlength=len(lengths))
+            long_runs[value] = [runs.tolist() for runs in np.split(run_lengths[found], np.cumsum(counts)[:-1])] if len(lengths) else []
+        return long_runs
+
+
+def detectPatterns(values, offsets, Lmin, Lmax, min_tags) -> list:
+    """
+    Runs the pattern detection of PTV on several tag sequences laid one after another, the unit of work
+    sent to a worker process as two flat arrays
+
+    Arguments:
+    values -- int8 tag values of the sequences, each in the order its tags were created
+    offsets -- sequence i is values[offsets[i]:offsets[i + 1]]
+
+    Return:
+    list of the PTV result of every sequence
+    """
+    pattern_detection = PatternDetection()
+    results = []
+    for start, end in zip(offsets[:-1].tolist(), offsets[1:].tolist()):
+        codes = values[start:end]
+        results.append(pattern_detection.SequencePatterns(codes, decodeValues(codes), Lmin, Lmax, min_tags))
+    return results
@@ -0,0 +1,267 @@
+from abc import abstractmethod
+from DataSource import DataSource
+import csv
+
+BATCH_SIZE = 5000     # default number of rows pulled from the server per fetchmany round-trip
+POOL_SIZE = 4         # default number of pooled connections, one per concurrent snapshot query
+
+
+class SQLDataSource(DataSource):
+    """
+    Queries of the pipeline against the tables of expertiza_production, shared by the MySQL and SQLite data sources.
+    Subclasses open the connections, with _connect setting up the pool and the query threads and _connection
+    checking a connection out for the duration of a with block.
+    """
+    def __init__(self, assignment_ids=(1166,), pool_size=POOL_SIZE) -> None:
+        self.assignment_ids = tuple(assignment_ids)     # assignments whose tags are fetched by the queries
+        self._answer_counts = {}                        # cache of answer counts per team for the current run
+        self._connect(pool_size)
+    
+    @abstractmethod
+    def _connect(self, pool_size=POOL_SIZE) -> None:
+        """
+        Sets up the connections and the threads issuing queries concurrently
+        """
+
+    @abstractmethod
+    def _connection(self):
+        """
+        Checks a connection out for the duration of a with block
+        Yields:
+            connection: connection with the cursor interface of mysql.connector
+        """
+
+    def submit(self, method, *args, **kwargs):
+        """
+        Schedules a fetch method on the query thread pool, so it runs concurrently on its own pooled connection
+        Args:
+            method (callable): fetch method of this class, e.g. self.getTeamMembers
+        Returns:
+            Future: future holding the result of the method
+        """
+        return self._executor.submit(method, *args, **kwargs)
+
+    def close(self) -> None:
+        """
+        Stops the query thread pool once the connector is no longer needed
+        """
+        self._executor.shutdown(wait=True)
+
+    def _assignmentFilter(self, column, assignment_ids=None):
+        """
+        Builds the `column in (...)` condition restricting a query to a set of assignments
+        Args:
+            column (str): column holding the assignment id, e.g. t.assignment_id
+            assignment_ids (iterable, optional): assignments to keep, defaults to the assignments of this connector
+        Returns:
+            tuple: SQL condition and the parameters to execute it with
+        """
+        assignment_ids = tuple(self.assignment_ids if assignment_ids is None else assignment_ids)
+        placeholders = ", ".join(["%s"] * len(assignment_ids))
+        return f"{column} in ({placeholders})", assignment_ids
+
+    def getTaggedAssignments(self, assignment_ids) -> list[int]:
+        """
+        Fetches which of the given assignments have at least one answer tag
+        Args:
+            assignment_ids (iterable): candidate assignment ids
+        Returns:
+            list[int]: sorted ids of the assignments that were tagged
+        """
+        condition, params = self._assignmentFilter("t.assignment_id", assignment_ids)
+        with self._connection() as connection:
+            cursor = connection.cursor()
+            cursor.execute(f"SELECT DISTINCT t.assignment_id FROM answer_tags a inner join tag_prompt_deployments t on a.tag_prompt_deployment_id=t.id where {condition};", params)
+            return sorted(assignment_id for assignment_id, in cursor.fetchall())
+        
+    def _streamRows(self, query, params=(), batch_size=BATCH_SIZE):
+        """
+        Executes a query on an unbuffered cursor and yields the result set in batches of fetchmany rows,
+        so that rows are pulled from the server as they are consumed instead of being buffered all at once
+        Args:
+            query (str): SQL query to execute
+            params (tuple): parameters substituted into the query
+            batch_size (int): number of rows fetched per round-trip
+        Yields:
+            list[tuple]: next batch of at most batch_size rows
+        """
+        with self._connection() as connection:
+            cursor = connection.cursor(buffered=False)
+            exhausted = False
+            try:
+                cursor.execute(query, params)
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        exhausted = True
+                        break
+                    yield rows
+            finally:
+                # An abandoned unbuffered result has to be drained before the connection can be reused
+                if not exhausted:
+                    connection.consume_results()
+                cursor.close()
+
+    def getWatermark(self) -> dict:
+        """
+        Fetches the change watermark of the tags of every assignment, used to tell whether cached results are stale
+        Returns:
+            dict: {assignment_id: (max(updated_at), number of tags)}
+        """
+        condition, params = self._assignmentFilter("t.assignment_id")
+        with self._connection() as connection:
+            cursor = connection.cursor()
+            cursor.execute(f"SELECT t.assignment_id, max(a.updated_at), count(*) FROM answer_tags a inner join tag_prompt_deployments t on a.tag_prompt_deployment_id=t.id where {condition} group by t.assignment_id;", params)
+            return {assignment_id: (updated_at, count) for assignment_id, updated_at, count in cursor.fetchall()}
+
+    def iterTagRows(self, batch_size=BATCH_SIZE, updated_since=None):
+        """
+        Streams the raw rows of answer_tags joined with tag_prompt_deployments, without building objects
+        Args:
+            batch_size (int): number of rows fetched per round-trip
+            updated_since (datetime, optional): only stream the tags updated at or after this time
+        Yields:
+            list[tuple]: batch of (id, assignment_id, answer_id, tag_prompt_deployment_id, user_id, value, created_at, updated_at, tag_prompt_id) rows
+        """
+        # Join query to fetch answer tag fields and assignment ID by performing inner join on answer_tags and tag_prompt_deployments tables
+        condition, params = self._assignmentFilter("t.assignment_id")
+        if updated_since is not None:
+            condition, params = f"{condition} and a.updated_at >= %s", params + (updated_since,)
+        query = f"SELECT a.id, t.assignment_id, a.answer_id, a.tag_prompt_deployment_id, a.user_id, a.value, a.created_at, a.updated_at, t.tag_prompt_id FROM answer_tags a inner join tag_prompt_deployments t on a.tag_prompt_deployment_id=t.id where {condition};"
+        yield from self._streamRows(query, params, batch_size)
+
+    def getTeamMembers(self) -> list[tuple]:
+        """
+        Fetches the team membership side table of the assignments
+        Returns:
+            list[tuple]: (assignment_id, user_id, team_id) rows
+        """
+        condition, params = self._assignmentFilter("v2.assignment_id")
+        with self._connection() as connection:
+            cursor = connection.cursor()
+            cursor.execute(f"select v2.assignment_id, v2.user_id, v2.team_id from view2 v2 where {condition};", params)
+            return cursor.fetchall()
+
+    def getAnswerTexts(self, answer_ids=None) -> dict:
+        """
+        Fetches the question and answer text side table of every answer tagged in the assignments.
+        The answers and the text of their distinct questions are fetched separately and joined by question id,
+        so a question shared by many answers is transferred once.
+        Args:
+            answer_ids (iterable, optional): only fetch these answers
+        Returns:
+            dict: {answer_id: (question_id, question, answer_score, comments)}
+        """
+        if answer_ids is None:
+            condition, params = self._assignmentFilter("t.assignment_id")
+            condition = f"ans.id in (SELECT a.answer_id FROM answer_tags a inner join tag_prompt_deployments t on a.tag_prompt_deployment_id = t.id where {condition})"
+        else:
+            params = tuple(answer_ids)
+            if not params:
+                return {}
+            condition = f"ans.id in ({', '.join(['%s'] * len(params))})"
+        query = f"SELECT ans.id, ans.question_id, ans.answer, ans.comments FROM answers ans where {condition};"
+        with self._connection() as connection:
+            cursor = connection.cursor()
+            cursor.execute(query, params)
+            answers = cursor.fetchall()
+        questions = self.getQuestions({question_id for _, question_id, _, _ in answers})
+        return {answer_id: (question_id, questions[question_id], answer_score, comments)
+                for answer_id, question_id, answer_score, comments in answers if question_id in questions}
+
+    def getQuestions(self, question_ids) -> dict:
+        """
+        Fetches the text of questions
+        Args:
+            question_ids (iterable): questions to fetch
+        Returns:
+            dict: {question_id: text}
+        """
+        params = tuple(question_ids)
+        if not params:
+            return {}
+        query = f"SELECT q.id, q.txt FROM questions q where q.id in ({', '.join(['%s'] * len(params))});"
+        with self._connection() as connection:
+            cursor = connection.cursor()
+            cursor.execute(query, params)
+            return dict(cursor.fetchall())
+
+    def getTagPrompts(self) -> dict:
+        """
+        Fetches the text of the tag prompts deployed in the assignments
+        Returns:
+            dict: {tag_prompt_id: prompt}
+        """
+        condition, params = self._assignmentFilter("t.assignment_id")
+        query = f"SELECT tp.id, tp.prompt FROM tag_prompts tp where tp.id in (SELECT t.tag_prompt_id FROM tag_prompt_deployments t where {condition});"
+        with self._connection() as connection:
+            cursor = connection.cursor()
+            cursor.execute(query, params)
+            return dict(cursor.fetchall())
+
+    def getAnswerCounts(self, team_ids, export_path=None) -> dict:
+        """
+        Fetches the number of answers associated with each of the given teams using a single grouped query.
+        Counts are cached for the lifetime of the connector, so only teams not seen before reach the database.
+
+        Args:
+            team_ids (iterable): The team IDs to query for.
+            export_path (str, optional): If given, the answers of all the teams are written once to this CSV file.
+
+        Returns:
+            dict: The number of answers for every given team_id, {team_id: count}.
+        """
+
+        """
+        OLD QUERY NOT IN USE FOR NOW
+        query = '''
+        SELECT a.*
+        FROM response_maps rm
+        INNER JOIN responses r ON rm.id = r.map_id
+        INNER JOIN answers a ON r.id = a.response_id
+        WHERE rm.reviewee_id = %s AND rm.type = "ReviewResponseMap" AND COALESCE(a.comments, '') <> '';
+
+        '''
+        """
+
+        team_ids = sorted({int(team_id) for team_id in team_ids})
+        missing = [team_id for team_id in team_ids if team_id not in self._answer_counts]
+        placeholders = ", ".join(["%s"] * len(team_ids))
+        conditions = '''rm.type = 'ReviewResponseMap' AND r.is_submitted = 1 AND a.comments <> '' AND a.answer is NOT NULL'''
+
+        with self._connection() as connection:
+            cursor = connection.cursor()
+            if missing:
+                # One GROUP BY query answers every team that is not cached yet
+                missing_placeholders = ", ".join(["%s"] * len(missing))
+                cursor.execute(f'''
+                SELECT rm.reviewee_id, COUNT(*)
+                FROM response_maps rm 
+                INNER JOIN responses r ON rm.id = r.map_id 
+                INNER JOIN answers a on r.id = a.response_id
+                WHERE rm.reviewee_id IN ({missing_placeholders}) AND {conditions}
+                GROUP BY rm.reviewee_id;
+                ''', tuple(missing))
+                counts = dict(cursor.fetchall())
+                # Teams without any answers do not appear in the grouped result
+                for team_id in missing:
+                    self._answer_counts[team_id] = counts.get(team_id, 0)
+
+            if export_path is not None and team_ids:
+                cursor.execute(f'''
+                SELECT a.*
+                FROM response_maps rm 
+                INNER JOIN responses r ON rm.id = r.map_id 
+                INNER JOIN answers a on r.id = a.response_id
+                WHERE rm.reviewee_id IN ({placeholders}) AND {conditions};
+                ''', tuple(team_ids))
+                answers = cursor.fetchall()
+
+                # Write to CSV file once for all the teams
+                with open(export_path, 'w', newline='', encoding='utf-8') as file:
+                    writer = csv.writer(file)
+                    # Writing headers
+                    writer.writerow([i[0] for i in cursor.description])
+                    writer.writerows(answers)
+
+        return {team_id: self._answer_counts[team_id] for team_id in team_ids}
@@ -0,0 +1,100 @@
+from SQLDataSource import SQLDataSource, POOL_SIZE
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+import sqlite3
+import threading
+
+# Tables and views of expertiza_production read by the pipeline, in SQLite form
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tag_prompts (id INTEGER PRIMARY KEY, prompt TEXT);
+CREATE TABLE IF NOT EXISTS tag_prompt_deployments (id INTEGER PRIMARY KEY, assignment_id INTEGER, tag_prompt_id INTEGER);
+CREATE TABLE IF NOT EXISTS questions (id INTEGER PRIMARY KEY, txt TEXT);
+CREATE TABLE IF NOT EXISTS teams (id INTEGER PRIMARY KEY, parent_id INTEGER);
+CREATE TABLE IF NOT EXISTS teams_users (id INTEGER PRIMARY KEY, team_id INTEGER, user_id INTEGER);
+CREATE TABLE IF NOT EXISTS response_maps (id INTEGER PRIMARY KEY, reviewee_id INTEGER, type TEXT);
+CREATE TABLE IF NOT EXISTS responses (id INTEGER PRIMARY KEY, map_id INTEGER, is_submitted INTEGER);
+CREATE TABLE IF NOT EXISTS answers (id INTEGER PRIMARY KEY, question_id INTEGER, answer INTEGER, comments TEXT, response_id INTEGER);
+CREATE TABLE IF NOT EXISTS answer_tags (id INTEGER PRIMARY KEY, answer_id INTEGER, tag_prompt_deployment_id INTEGER, user_id INTEGER,
+                                        value TEXT, created_at TIMESTAMP, updated_at TIMESTAMP);
+CREATE INDEX IF NOT EXISTS answer_tags_deployment ON answer_tags (tag_prompt_deployment_id);
+CREATE INDEX IF NOT EXISTS response_maps_reviewee ON response_maps (reviewee_id);
+CREATE INDEX IF NOT EXISTS responses_map ON responses (map_id);
+CREATE INDEX IF NOT EXISTS answers_response ON answers (response_id);
+CREATE VIEW IF NOT EXISTS view1 AS
+    SELECT a.id, a.answer_id, a.tag_prompt_deployment_id, a.user_id, a.value, t.tag_prompt_id, t.assignment_id, a.created_at, a.updated_at
+    FROM answer_tags a INNER JOIN tag_prompt_deployments t ON a.tag_prompt_deployment_id = t.id;
+CREATE VIEW IF NOT EXISTS view2 AS
+    SELECT tu.user_id, tu.team_id, t.parent_id AS assignment_id FROM teams_users tu INNER JOIN teams t ON tu.team_id = t.id;
+"""
+
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(" "))
+sqlite3.register_converter("TIMESTAMP", lambda value: datetime.fromisoformat(value.decode()))
+
+
+class SQLiteDataSource(SQLDataSource):
+    """
+    Offline data source backed by a SQLite file with the tables of expertiza_production (see SCHEMA).
+    It runs the same queries as the MySQL class, those of SQLDataSource, so the pipeline can be run and load-tested without the database dump.
+    """
+    def __init__(self, path, assignment_ids=(1166,), pool_size=POOL_SIZE) -> None:
+        self.path = path        # SQLite database file
+        super().__init__(assignment_ids, pool_size)
+
+    def _connect(self, pool_size=POOL_SIZE) -> None:
+        # SQLite connections are cheap, every query opens its own one, bounded like the MySQL pool
+        self._pool_slots = threading.BoundedSemaphore(pool_size)
+        self._executor = ThreadPoolExecutor(max_workers=pool_size)
+
+    @contextmanager
+    def _connection(self):
+        """
+        Opens a connection to the SQLite file for the duration of a with block
+        Yields:
+            _SQLiteConnection: connection accepting the MySQL flavoured queries
+        """
+        with self._pool_slots:
+            connection = sqlite3.connect(self.path, detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False)
+            try:
+                yield _SQLiteConnection(connection)
+            finally:
+                connection.close()
+
+    def getWatermark(self) -> dict:
+        """
+        Fetches the change watermark of the tags of every assignment
+        Returns:
+            dict: {assignment_id: (max(updated_at), number of tags)}
+        """
+        # Aggregates lose the declared column type in SQLite, so the timestamps come back as text
+        return {assignment_id: (datetime.fromisoformat(updated_at) if isinstance(updated_at, str) else updated_at, count)
+                for assignment_id, (updated_at, count) in super().getWatermark().items()}
+
+
+class _SQLiteConnection:
+    """
+    Wraps a sqlite3 connection to accept the calls SQLDataSource makes on a MySQL connection
+    """
+    def __init__(self, connection) -> None:
+        self._connection = connection
+
+    def cursor(self, buffered=True):
+        # sqlite3 cursors always step through the result lazily, so buffering does not apply
+        return _SQLiteCursor(self._connection.cursor())
+
+    def consume_results(self) -> None:
+        pass
+
+
+class _SQLiteCursor:
+    """
+    Wraps a sqlite3 cursor to translate the %s placeholders of MySQL queries into SQLite ones
+    """
+    def __init__(self, cursor) -> None:
+        self._cursor = cursor
+
+    def execute(self, query, params=()):
+        return self._cursor.execute(query.replace("%s", "?"), tuple(params))
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
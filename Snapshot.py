@@ -0,0 +1,263 @@
+from Models.TagTable import TagTable, encodeRow
+from Models.RaterMatrix import RaterMatrix
+from MySQL import BATCH_SIZE
+from concurrent.futures import wait
+import numpy as np
+import os
+
+
+class Snapshot:
+    """
+    Columnar snapshot of the tagging data of a set of assignments. The tag rows are read with a single scan of
+    answer_tags joined with tag_prompt_deployments, team membership and question/answer text are kept as side tables,
+    and the views used by the pipeline are derived from them in memory.
+    """
+    TAG_COLUMNS = TagTable.COLUMNS
+    CACHE_VERSION = 2           # format of the cached files, older files are fetched again
+
+    def __init__(self) -> None:
+        self.tags = TagTable()      # tag rows ordered by tag id, one typed array per column
+        self.team_members = []      # (assignment_id, user_id, team_id) membership rows
+        self.answers = {}           # answer_id -> (question_id, question, answer_score, comments)
+        self.prompts = {}           # tag_prompt_id -> prompt
+        self._rater_matrix = None   # item x rater matrix of every team, built once
+        self.watermark = {}         # {assignment_id: (max(updated_at), number of tags)} the snapshot is current to
+        self.base_watermark = None  # watermark of the cached snapshot a delta was applied to
+        self.changed_users = None   # (assignment_id, user_id) pairs touched by the delta, None if everything was loaded
+
+    def __len__(self) -> int:
+        return len(self.tags)
+
+    @classmethod
+    def load(cls, connector, batch_size=BATCH_SIZE):
+        """
+        Loads a snapshot with one scan of the tag rows. The side tables are fetched concurrently on their own
+        pooled connections while the tag rows stream in.
+        Args:
+            connector (MySQL): connector of the assignments to load
+            batch_size (int): number of tag rows fetched per round-trip
+        Returns:
+            Snapshot: the loaded snapshot
+        """
+        snapshot = cls()
+        members_future = connector.submit(connector.getTeamMembers)
+        answers_future = connector.submit(connector.getAnswerTexts)
+        prompts_future = connector.submit(connector.getTagPrompts)
+
+        # Every batch is encoded into typed arrays as it arrives, so the raw rows do not outlive their batch
+        snapshot.tags = _byId(TagTable.concat([TagTable.fromRows(rows) for rows in connector.iterTagRows(batch_size)]))
+
+        wait([members_future, answers_future, prompts_future])
+        snapshot.team_members = members_future.result()
+        snapshot.answers = answers_future.result()
+        snapshot.prompts = prompts_future.result()
+        print(f"Snapshot loaded with {len(snapshot)} tags.........")
+        return snapshot
+
+    @classmethod
+    def loadCached(cls, connector, cache_dir, batch_size=BATCH_SIZE, refresh=False, incremental=False):
+        """
+        Loads the snapshot from the local cache, going back to the database only when the watermark of the
+        assignments (latest updated_at and number of tags) shows new or changed tags, or when a refresh is forced
+        Args:
+            connector (MySQL): connector of the assignments to load
+            cache_dir (str): directory holding the cached snapshots
+            batch_size (int): number of tag rows fetched per round-trip
+            refresh (bool): ignore the cache and fetch a fresh snapshot
+            incremental (bool): bring a stale cached snapshot up to date with only the tags updated since its watermark
+        Returns:
+            Snapshot: the loaded snapshot
+        """
+        path = os.path.join(cache_dir, "snapshot_" + "-".join(str(assignment_id) for assignment_id in connector.assignment_ids) + ".npz")
+        watermark = connector.getWatermark()
+        cached = cls.fromFile(path) if not refresh and os.path.exists(path) else None
+        if cached is not None:
+            snapshot, cached_watermark = cached
+            snapshot.watermark = snapshot.base_watermark = cached_watermark
+            if cached_watermark == watermark:
+                print(f"Snapshot loaded from cache {path}")
+                snapshot.changed_users = set()
+                return snapshot
+            if incremental and snapshot.applyDelta(connector, watermark, batch_size):
+                print(f"Cached snapshot {path} brought up to date with {len(snapshot.changed_users)} changed user(s)")
+                snapshot.save(path, watermark)
+                return snapshot
+            print(f"Cached snapshot {path} is stale, fetching from the database")
+
+        snapshot = cls.load(connector, batch_size)
+        snapshot.watermark = watermark
+        os.makedirs(cache_dir, exist_ok=True)
+        snapshot.save(path, watermark)
+        return snapshot
+
+    def applyDelta(self, connector, watermark, batch_size=BATCH_SIZE) -> bool:
+        """
+        Merges the tags updated since the watermark of this snapshot into it, replacing rows by tag id.
+        The users whose tags changed are recorded in changed_users.
+        Deleted tags and changed team membership cannot be seen in the delta, so they make the merge fail
+        and the caller has to load the snapshot in full.
+        Args:
+            connector (MySQL): connector of the assignments of the snapshot
+            watermark (dict): current watermark of the assignments
+            batch_size (int): number of tag rows fetched per round-trip
+        Returns:
+            bool: whether the snapshot is now current to the watermark
+        """
+        if set(self.watermark) != set(watermark):
+            return False
+        # Rows updated in the same second as the watermark may not have been seen yet, so the bound is inclusive
+        since = min((updated_at for updated_at, _ in self.watermark.values()), default=None)
+
+        members_future = connector.submit(connector.getTeamMembers)
+        prompts_future = connector.submit(connector.getTagPrompts)
+        positions = dict(zip(self.tags.id.tolist(), range(len(self.tags))))
+        changed_users = set()
+        new_rows = {}
+        for rows in connector.iterTagRows(batch_size, since):
+            for row in rows:
+                encoded_row = encodeRow(row)
+                position = positions.get(row[0])
+                if position is None:
+                    new_rows[row[0]] = encoded_row
+                    changed_users.add((row[1], row[4]))
+                elif self.tags.row(position) != encoded_row:
+                    changed_users.add((self.tags.assignment_id[position].item(), self.tags.user_id[position].item()))
+                    changed_users.add((row[1], row[4]))
+                    self.tags.setRow(position, encoded_row)
+        if new_rows:
+            added = TagTable({column: np.array(values, dtype=TagTable.DTYPES[column]) for column, values in zip(self.TAG_COLUMNS, zip(*new_rows.values()))})
+            # New tags go where a full load puts them, so both leave the rows in the same order
+            self.tags = _byId(TagTable.concat([self.tags, added]))
+        self._rater_matrix = None
+
+        # Tags were deleted if the merged counts do not match the watermark
+        assignment_ids, assignment_counts = np.unique(self.tags.assignment_id, return_counts=True)
+        counts = dict(zip(assignment_ids.tolist(), assignment_counts.tolist()))
+        team_members = members_future.result()
+        self.prompts = prompts_future.result()
+        if any(counts.get(assignment_id, 0) != count for assignment_id, (_, count) in watermark.items()):
+            return False
+        if sorted(team_members) != sorted(self.team_members):
+            return False
+
+        # Only the text of answers tagged for the first time is fetched
+        self.answers.update(connector.getAnswerTexts({answer_id for answer_id in np.unique(self.tags.answer_id).tolist() if answer_id not in self.answers}))
+        self.watermark = watermark
+        self.changed_users = changed_users
+        return True
+
+    def save(self, path, watermark) -> None:
+        """
+        Writes the snapshot to disk as typed columns in a NumPy .npz archive
+        Args:
+            path (str): file to write
+            watermark (dict): {assignment_id: (max(updated_at), number of tags)} the snapshot was loaded at
+        """
+        columns = {"version": np.array(self.CACHE_VERSION)}
+        for column, values in self.tags.columns().items():
+            columns[f"tags.{column}"] = values
+
+        members = list(zip(*self.team_members)) or [(), (), ()]
+        for name, values in zip(("assignment_id", "user_id", "team_id"), members):
+            _encodeColumn(columns, f"members.{name}", values, "int")
+
+        answers = list(zip(*((answer_id, *text) for answer_id, text in self.answers.items()))) or [(), (), (), (), ()]
+        for name, values, kind in zip(("answer_id", "question_id", "question", "answer_score", "comments"), answers, ("int", "int", "str", "int", "str")):
+            _encodeColumn(columns, f"answers.{name}", values, kind)
+
+        _encodeColumn(columns, "prompts.tag_prompt_id", list(self.prompts.keys()), "int")
+        _encodeColumn(columns, "prompts.prompt", list(self.prompts.values()), "str")
+
+        assignment_ids = sorted(watermark)
+        _encodeColumn(columns, "watermark.assignment_id", assignment_ids, "int")
+        _encodeColumn(columns, "watermark.updated_at", [watermark[assignment_id][0] for assignment_id in assignment_ids], "datetime")
+        _encodeColumn(columns, "watermark.count", [watermark[assignment_id][1] for assignment_id in assignment_ids], "int")
+
+        # Written under a temporary name first, so concurrent readers never see a partial file
+        temp_path = path + ".tmp.npz"
+        np.savez(temp_path, **columns)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def fromFile(cls, path):
+        """
+        Reads a snapshot written by save
+        Args:
+            path (str): file to read
+        Returns:
+            tuple: the snapshot and the watermark it was loaded at, None if the file was written in an older format
+        """
+        snapshot = cls()
+        with np.load(path, allow_pickle=False) as columns:
+            if "version" not in columns or columns["version"] != cls.CACHE_VERSION:
+                return None
+            snapshot.tags = TagTable({column: columns[f"tags.{column}"] for column in cls.TAG_COLUMNS})
+
+            snapshot.team_members = list(zip(*(_decodeColumn(columns, f"members.{name}") for name in ("assignment_id", "user_id", "team_id"))))
+
+            answer_ids, *texts = (_decodeColumn(columns, f"answers.{name}") for name in ("answer_id", "question_id", "question", "answer_score", "comments"))
+            snapshot.answers = dict(zip(answer_ids, zip(*texts)))
+            snapshot.prompts = dict(zip(_decodeColumn(columns, "prompts.tag_prompt_id"), _decodeColumn(columns, "prompts.prompt")))
+
+            watermark = {assignment_id: (updated_at, count) for assignment_id, updated_at, count in zip(
+                _decodeColumn(columns, "watermark.assignment_id"), _decodeColumn(columns, "watermark.updated_at"), _decodeColumn(columns, "watermark.count"))}
+        return snapshot, watermark
+
+    def raterMatrix(self) -> RaterMatrix:
+        """
+        Derives the item x rater matrix of the tags of every team, in place of the {assignment_id: {team_id: {user_id: {answer_id: {tag_prompt_id: tag}}}}} team hierarchy.
+        Like the inner join with the membership view, tags of users without a team are left out and
+        tags of users in several teams of an assignment are added to each of them.
+        Returns:
+            RaterMatrix: matrix of every team, built once and shared by the team level metrics
+        """
+        if self._rater_matrix is None:
+            self._rater_matrix = RaterMatrix.build(self.tags, self.team_members)
+        return self._rater_matrix
+
+    def historyTags(self) -> TagTable:
+        """
+        Returns:
+            TagTable: the tags of the user history, those whose answer and prompt are known
+        """
+        known = np.isin(self.tags.answer_id, list(self.answers)) & np.isin(self.tags.tag_prompt_id, list(self.prompts))
+        return self.tags[known]
+
+
+def _byId(tags) -> TagTable:
+    """
+    Returns the tags ordered by tag id, the table itself if it already is. Every view of the snapshot, and every
+    tie between tags created at the same time, follows this order whatever order the database returned the rows in
+    """
+    return tags if np.all(tags.id[1:] > tags.id[:-1]) else tags.sortedBy("id")
+
+
+def _encodeColumn(columns, name, values, kind) -> None:
+    """
+    Stores a column of Python values as a typed NumPy array plus a mask of the NULL entries
+    Args:
+        columns (dict): arrays being written, updated in place
+        name (str): name of the column
+        values (list): column values, None for NULL
+        kind (str): "int", "str" or "datetime"
+    """
+    nulls = np.array([value is None for value in values], dtype=bool)
+    if kind == "int":
+        array = np.array([0 if value is None else value for value in values], dtype=np.int64)
+    elif kind == "str":
+        array = np.array(["" if value is None else str(value) for value in values], dtype=str)
+    else:
+        array = np.array(values, dtype="datetime64[us]")
+    columns[name] = array
+    columns[name + ".nulls"] = nulls
+
+
+def _decodeColumn(columns, name) -> list:
+    """
+    Reads back a column stored by _encodeColumn as a list of Python values
+    """
+    values = columns[name].tolist()
+    nulls = columns[name + ".nulls"]
+    if nulls.any():
+        values = [None if null else value for value, null in zip(values, nulls.tolist())]
+    return values
@@ -0,0 +1,111 @@
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import hashlib
+import os
+import pickle
+
+
+class Stage:
+    """
+    A stage of the pipeline, computing its output from the outputs of the stages it depends on and from its parameters
+    """
+    def __init__(self, name, run, inputs=(), params=None, memoize=True, version=1) -> None:
+        self.name = name                    # name the stages depending on this one refer to it by
+        self.run = run                      # function computing the output of the stage, called once its inputs are ready
+        self.inputs = tuple(inputs)         # names of the stages and sources the output is computed from
+        self.params = dict(params or {})    # parameters the output depends on
+        self.memoize = memoize              # whether the output is kept under the hash of its inputs and parameters
+        self.version = version              # version of the computation, bumped when it changes so older outputs are not reused
+
+
+class StageGraph:
+    """
+    Small DAG of pipeline stages. A stage starts as soon as every stage it depends on is done, so independent
+    stages run concurrently on threads, and the output of a stage is pickled under a hash of its name, version,
+    parameters and the hashes of its inputs. A later run with the same inputs and parameters loads the output
+    instead of computing it, so changing a parameter only re-executes the stages depending on it.
+    """
+    def __init__(self, stages, sources=None, memo_dir=None, reuse=True) -> None:
+        self.stages = {stage.name: stage for stage in stages}
+        # {name: hash} of the inputs given from outside the graph, from a value identifying their content
+        self.sources = {name: _hash(value) for name, value in (sources or {}).items()}
+        self.memo_dir = memo_dir            # directory the outputs of the stages are memoized in, None to not memoize
+        self.reuse = reuse                  # whether memoized outputs are loaded, otherwise every stage is computed again
+        self.keys = {}                      # hash of the output of every stage
+        for name in self._order():
+            stage = self.stages[name]
+            self.keys[name] = _hash((stage.name, stage.version, sorted((param, repr(value)) for param, value in stage.params.items()),
+                                     [self.keys.get(input_name) or self.sources[input_name] for input_name in stage.inputs]))
+
+    def _order(self) -> list:
+        """
+        Orders the stages so every stage comes after its inputs
+        """
+        order, done = [], set(self.sources)
+        while len(order) < len(self.stages):
+            ready = [name for name, stage in self.stages.items() if name not in done and all(input_name in done for input_name in stage.inputs)]
+            if not ready:
+                missing = {name: stage.inputs for name, stage in self.stages.items() if name not in done}
+                raise ValueError(f"stages with unknown or cyclic inputs: {missing}")
+            order.extend(ready)
+            done.update(ready)
+        return order
+
+    def _memoPath(self, name) -> str:
+        """
+        Returns the path of the memoized output of a stage
+        """
+        return os.path.join(self.memo_dir, f"{name}_{self.keys[name]}.pkl")
+
+    def _runStage(self, stage):
+        """
+        Loads the memoized output of a stage, or computes and memoizes it
+        """
+        memoize = stage.memoize and self.memo_dir is not None
+        if memoize and self.reuse and os.path.exists(self._memoPath(stage.name)):
+            with open(self._memoPath(stage.name), "rb") as f:
+                output = pickle.load(f)
+            print(f"Stage {stage.name} reused from {self._memoPath(stage.name)}")
+            return output
+
+        output = stage.run()
+        print(f"Stage {stage.name} computed")
+        if memoize:
+            os.makedirs(self.memo_dir, exist_ok=True)
+            with open(self._memoPath(stage.name) + ".tmp", "wb") as f:
+                pickle.dump(output, f)
+            os.replace(self._memoPath(stage.name) + ".tmp", self._memoPath(stage.name))
+        return output
+
+    def run(self, on_done=None) -> dict:
+        """
+        Runs every stage, each one as soon as its inputs are done
+
+        Args:
+            on_done (callable, optional): called with the name and output of every stage once it is done, before the stages depending on it start
+
+        Returns:
+            dict: {stage name: output} of every stage
+        """
+        outputs = {}
+        pending = self._order()
+        with ThreadPoolExecutor(max_workers=max(1, len(self.stages))) as executor:
+            running = {}
+            while pending or running:
+                ready = [name for name in pending if all(input_name in outputs or input_name in self.sources for input_name in self.stages[name].inputs)]
+                for name in ready:
+                    pending.remove(name)
+                    running[executor.submit(self._runStage, self.stages[name])] = name
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    outputs[name] = future.result()
+                    if on_done is not None:
+                        on_done(name, outputs[name])
+        return outputs
+
+
+def _hash(value) -> str:
+    """
+    Hashes the repr of a value made of strings, numbers, tuples and lists
+    """
+    return hashlib.sha256(repr(value).encode()).hexdigest()[:20]
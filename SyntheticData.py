@@ -0,0 +1,178 @@
+import argparse
+import os
+import sqlite3
+import numpy as np
+from SQLiteDataSource import SCHEMA
+
+# First id of every table, kept apart like the id ranges of the production tables
+FIRST_IDS = {"tag_prompt_deployments": 1001, "questions": 5001, "teams": 20001, "users": 50001, "teams_users": 50001,
+             "response_maps": 100001, "responses": 100001, "answers": 500001, "answer_tags": 5000001}
+
+PROMPTS = ["Contains suggestion?", "Mentions problems?", "Explains reasoning?", "Is positive?", "Is localized?",
+           "Is helpful?", "Contains praise?", "Is specific?"]
+
+
+class SyntheticData:
+    """
+    Generates realistic synthetic crowd-labeling data (assignments, teams, users, answers and answer_tags with
+    timestamps) into a SQLite file readable by SQLiteDataSource, so every stage can be measured at any scale
+    without the expertiza_production dump.
+
+    Every member of a team tags the review comments the team received. Regular taggers agree with the hidden
+    label of an item unless they disagree at random, fast taggers leave only a few seconds between tags and
+    pattern taggers repeat a fixed periodic sequence of values regardless of the item.
+    """
+    def __init__(self, assignments=1, teams=50, team_size=4, reviews_per_team=5, questions=10, tag_prompts=5,
+                 coverage=0.9, fast_tagger_rate=0.1, pattern_rate=0.05, disagreement=0.15, first_assignment_id=1166, seed=0) -> None:
+        self.assignments = assignments              # number of assignments
+        self.teams = teams                          # teams per assignment
+        self.team_size = team_size                  # users per team
+        self.reviews_per_team = reviews_per_team    # reviews every team receives
+        self.questions = questions                  # questions per review, one answer each
+        self.tag_prompts = min(tag_prompts, len(PROMPTS))   # tag prompts deployed per assignment
+        self.coverage = coverage                    # probability a user tags a given (answer, tag prompt) item
+        self.fast_tagger_rate = fast_tagger_rate    # fraction of users tagging too fast
+        self.pattern_rate = pattern_rate            # fraction of users tagging with a periodic pattern
+        self.disagreement = disagreement            # probability a regular user disagrees with the hidden label
+        self.first_assignment_id = first_assignment_id
+        self._rng = np.random.default_rng(seed)
+        self._ids = {}                              # next free id of every table
+
+    def _nextIds(self, table, count) -> np.ndarray:
+        """
+        Allocates count consecutive ids of a table
+        """
+        start = self._ids.get(table, FIRST_IDS[table])
+        self._ids[table] = start + count
+        return np.arange(start, start + count)
+
+    def generate(self, path) -> int:
+        """
+        Writes the synthetic dataset to a new SQLite file
+
+        Args:
+            path (str): SQLite file to create, replaced if it exists
+
+        Returns:
+            int: number of answer tags generated
+        """
+        if os.path.exists(path):
+            os.remove(path)
+        connection = sqlite3.connect(path)
+        connection.executescript(SCHEMA)
+        connection.executemany("INSERT INTO tag_prompts VALUES (?, ?)", list(enumerate(PROMPTS[:self.tag_prompts], start=1)))
+
+        total = 0
+        for assignment_id in range(self.first_assignment_id, self.first_assignment_id + self.assignments):
+            total += self._generateAssignment(connection, assignment_id)
+            connection.commit()
+        connection.close()
+        return total
+
+    def _generateAssignment(self, connection, assignment_id) -> int:
+        """
+        Generates the teams, reviews, answers and tags of one assignment
+
+        Returns:
+            int: number of answer tags generated
+        """
+        rng = self._rng
+        num_answers = self.reviews_per_team * self.questions
+
+        deployment_ids = self._nextIds("tag_prompt_deployments", self.tag_prompts)
+        connection.executemany("INSERT INTO tag_prompt_deployments VALUES (?, ?, ?)",
+                               zip(deployment_ids.tolist(), [assignment_id] * self.tag_prompts, range(1, self.tag_prompts + 1)))
+
+        question_ids = self._nextIds("questions", self.questions)
+        connection.executemany("INSERT INTO questions VALUES (?, ?)",
+                               ((int(question_id), f"<p>Question {position + 1} of assignment {assignment_id}: how well does the work meet the criterion?</p>")
+                                for position, question_id in enumerate(question_ids)))
+
+        # Teams and their members
+        team_ids = self._nextIds("teams", self.teams)
+        connection.executemany("INSERT INTO teams VALUES (?, ?)", zip(team_ids.tolist(), [assignment_id] * self.teams))
+        user_ids = self._nextIds("users", self.teams * self.team_size).reshape(self.teams, self.team_size)
+        member_team_ids = np.repeat(team_ids, self.team_size)
+        connection.executemany("INSERT INTO teams_users VALUES (?, ?, ?)",
+                               zip(self._nextIds("teams_users", member_team_ids.size).tolist(), member_team_ids.tolist(), user_ids.ravel().tolist()))
+
+        # Reviews received by every team, one answer per question
+        map_ids = self._nextIds("response_maps", self.teams * self.reviews_per_team)
+        connection.executemany("INSERT INTO response_maps VALUES (?, ?, 'ReviewResponseMap')",
+                               zip(map_ids.tolist(), np.repeat(team_ids, self.reviews_per_team).tolist()))
+        response_ids = self._nextIds("responses", map_ids.size)
+        connection.executemany("INSERT INTO responses VALUES (?, ?, 1)", zip(response_ids.tolist(), map_ids.tolist()))
+        answer_ids = self._nextIds("answers", response_ids.size * self.questions).reshape(self.teams, num_answers)
+        scores = rng.integers(0, 6, answer_ids.size)
+        connection.executemany("INSERT INTO answers VALUES (?, ?, ?, ?, ?)",
+                               ((answer_id, int(question_ids[position % self.questions]), score, f"Review comment {answer_id}, with some explanation,\nover two lines.", response_id)
+                                for position, (answer_id, score, response_id) in enumerate(zip(answer_ids.ravel().tolist(), scores.tolist(),
+                                                                                             np.repeat(response_ids, self.questions).tolist()))))
+
+        # Every (team member, answer of the team, tag prompt) combination is an item the member may tag
+        shape = (self.teams, self.team_size, num_answers, self.tag_prompts)
+        tagged = rng.random(shape) < self.coverage
+        team_index, member_index, answer_index, prompt_index = (index[tagged] for index in np.indices(shape))
+        tag_users = user_ids[team_index, member_index]
+        tag_answers = answer_ids[team_index, answer_index]
+        tag_deployments = deployment_ids[prompt_index]
+
+        # Regular taggers agree with the hidden label of the item unless they disagree at random
+        labels = rng.choice(np.array([-1, 1]), size=(self.teams, num_answers, self.tag_prompts))
+        values = labels[team_index, answer_index, prompt_index]
+        values = np.where(rng.random(values.size) < self.disagreement, -values, values)
+
+        # Each user tags their items in a random order
+        order = np.lexsort((rng.random(tag_users.size), tag_users))
+        tag_users, tag_answers, tag_deployments, values = tag_users[order], tag_answers[order], tag_deployments[order], values[order]
+        starts = np.flatnonzero(np.r_[True, tag_users[1:] != tag_users[:-1]])
+        counts = np.diff(np.r_[starts, tag_users.size])
+        sequence = np.arange(tag_users.size) - np.repeat(starts, counts)
+
+        # Pattern taggers repeat a periodic sequence of values, regardless of the item
+        user_kind = rng.random(user_ids.size)
+        pattern_users = user_kind < self.pattern_rate
+        fast_users = (user_kind >= self.pattern_rate) & (user_kind < self.pattern_rate + self.fast_tagger_rate)
+        user_position = np.searchsorted(user_ids.ravel(), tag_users)
+        periods = rng.integers(2, 7, user_ids.size)
+        patterns = rng.choice(np.array([-1, 1]), size=(user_ids.size, 6))
+        is_pattern = pattern_users[user_position]
+        pattern_values = patterns[user_position, sequence % periods[user_position]]
+        values = np.where(is_pattern, pattern_values, values)
+
+        # Gaps between consecutive tags of a user, a few seconds for fast taggers and around half a minute otherwise
+        gaps = np.where(fast_users[user_position], rng.exponential(2.0, tag_users.size), rng.lognormal(3.0, 0.8, tag_users.size))
+        gaps = np.round(gaps).astype(np.int64)
+        gaps[starts] = rng.integers(0, 14 * 24 * 3600, starts.size)    # first tag of every user somewhere in a two week window
+        offsets = np.cumsum(gaps) - np.repeat(np.cumsum(gaps)[starts] - gaps[starts], counts)
+        created_at = np.datetime64("2024-01-15T00:00:00") + offsets.astype("timedelta64[s]")
+        created_at = np.char.replace(created_at.astype(str), "T", " ")
+
+        tag_ids = self._nextIds("answer_tags", tag_users.size)
+        connection.executemany("INSERT INTO answer_tags VALUES (?, ?, ?, ?, ?, ?, ?)",
+                               zip(tag_ids.tolist(), tag_answers.tolist(), tag_deployments.tolist(), tag_users.tolist(),
+                                   values.astype(str).tolist(), created_at.tolist(), created_at.tolist()))
+        return int(tag_ids.size)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic crowd-labeling dataset into a SQLite file.")
+    parser.add_argument('--output', type=str, default=os.path.join("data", "synthetic.db"), help="SQLite file to create.")
+    parser.add_argument('--assignments', type=int, default=1, help="Number of assignments.")
+    parser.add_argument('--teams', type=int, default=50, help="Teams per assignment.")
+    parser.add_argument('--team_size', type=int, default=4, help="Users per team.")
+    parser.add_argument('--reviews_per_team', type=int, default=5, help="Reviews received by every team.")
+    parser.add_argument('--questions', type=int, default=10, help="Questions per review.")
+    parser.add_argument('--tag_prompts', type=int, default=5, help="Tag prompts deployed per assignment.")
+    parser.add_argument('--coverage', type=float, default=0.9, help="Probability that a user tags a given item.")
+    parser.add_argument('--fast_tagger_rate', type=float, default=0.1, help="Fraction of users tagging too fast.")
+    parser.add_argument('--pattern_rate', type=float, default=0.05, help="Fraction of users tagging with a periodic pattern.")
+    parser.add_argument('--disagreement', type=float, default=0.15, help="Probability that a regular user disagrees with the hidden label.")
+    parser.add_argument('--first_assignment_id', type=int, default=1166, help="Id of the first generated assignment.")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed.")
+    args = parser.parse_args()
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    generator = SyntheticData(args.assignments, args.teams, args.team_size, args.reviews_per_team, args.questions, args.tag_prompts,
+                              args.coverage, args.fast_tagger_rate, args.pattern_rate, args.disagreement, args.first_assignment_id, args.seed)
+    print(f"{generator.generate(args.output)} answer tags written to {args.output}")
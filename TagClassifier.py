@@ -1,35 +1,46 @@
 import numpy as np
-from collections import Counter
+import pandas as pd
+from Models.TagTable import TagTable, decodeValues
 
 
 class TagClassifier:
-    def calculateAgreementDisagreement(self, data) -> dict:
+    def agreementTable(self, matrix) -> pd.DataFrame:
         """
-        Calculates Agreement/Disagreement of the users with other users per their tags 
+        Calculates Agreement/Disagreement of the users with other users per their tags, for every (answer, tag prompt)
+        item of every team at once, from the value counts of the items. The major value of an item is its most frequent
+        value, ties going to the value of the first rater, and the fraction is its count over the raters of the team.
 
         Args:
-            data (array): 2d array where columns represent raters and rows represents tag_promot_ids
+            matrix (RaterMatrix): tags of every team
 
         Returns:
-            dict: dictionary of tags representing fractions of major .....
+            DataFrame: one row per item of every team, with the columns of tags.csv
         """
-        num_tags = data.shape[0]
-        raters = data.shape[1]
-        tags = {}
-        for i in range(num_tags):
-            row = []
-            answer_id = None
-            tag_prompt_id = None
-            for j in range(raters):
-                if data[i,j] is not None:
-                    #print(data[i,j])
-                    row.append(data[i,j].value)
-                    if not answer_id:
-                        answer_id = data[i,j].answer_id 
-                    if not tag_prompt_id:
-                        tag_prompt_id = data[i,j].tag_prompt_id
-            counter = Counter(row)
-            val,freq = counter.most_common(1)[0]
-            result = freq/raters
-            tags[answer_id] = {tag_prompt_id: [val, result]}
-        return tags
+        columns = ["Assignment_id", "team_id", "answer_id", "tag_prompt_id", "value", "fraction"]
+        if not len(matrix.values):
+            return pd.DataFrame(columns=columns)
+
+        # Number every (item, value) pair of all teams, values shifted into 0..255
+        entry_teams = np.repeat(np.arange(len(matrix)), np.diff(matrix.offsets))
+        items = matrix.item_offsets[entry_teams] + matrix.items
+        pair_keys = items * 256 + (matrix.values.astype(np.int64) - TagTable.MISSING)
+        pairs, pair_codes = np.unique(pair_keys, return_inverse=True)
+        counts = np.bincount(pair_codes)
+        first_rater = np.full(len(pairs), np.iinfo(np.int64).max)
+        np.minimum.at(first_rater, pair_codes, matrix.raters)
+
+        # Major pair of every item: highest count, then earliest rater
+        pair_items = pairs // 256
+        order = np.lexsort((first_rater, -counts, pair_items))
+        major = order[np.flatnonzero(np.r_[True, pair_items[order][1:] != pair_items[order][:-1]])]
+
+        item_teams = np.repeat(np.arange(len(matrix)), np.diff(matrix.item_offsets))
+        team_raters = np.diff(matrix.rater_offsets)
+        return pd.DataFrame({
+            "Assignment_id": matrix.assignment_ids[item_teams],
+            "team_id": matrix.team_ids[item_teams],
+            "answer_id": matrix.item_answer_ids,
+            "tag_prompt_id": matrix.item_prompt_ids,
+            "value": decodeValues((pairs[major] % 256 + TagTable.MISSING).astype(np.int8)),
+            "fraction": counts[major] / team_raters[item_teams],
+        }, columns=columns)
@@ -1,7 +1,6 @@
 import math
 import numpy as np
-import krippendorff
-from scipy import stats as st
+from Models.TagTable import TagTable
 
 class TaggerClassifier:
     """
@@ -10,7 +9,8 @@ class TaggerClassifier:
     def buildIntervalLogs(self, tags) -> int:
         """
         Gets the time difference in seconds between subsequent tags, applies log base 2 to the result, 
-        and finally return the average, as well as the number of tags
+        and finally return the average, as well as the number of tags.
+        Scalar version of computeIntervalLogs for the tags of a single user, kept as library API and as its reference
         Args:
             tags (list): list of answer tags
 
@@ -19,7 +19,7 @@ class TaggerClassifier:
         """
         if len(tags)==1:
             return (-1,1)                                       # Need to be discussed
-        
+
         tags.sort(key = lambda l: l.created_at)             # sorting the tags based on created_at
         result = 0
         
@@ -36,122 +36,241 @@ class TaggerClassifier:
         return (result, len(tags))
     
 
-    def intervalLogsForTags(self, tags):
+    def computeIntervalLogs(self, tags) -> dict:
         """
-        Calculates the interval log value for each tag.
+        Computes the interval logs of every user of every assignment at once. The tags are sorted by
+        (assignment_id, user_id, created_at), the gaps between subsequent tags of a user are taken with one diff
+        and reduced with log base 2 per user, giving the result of buildIntervalLogs for every user.
+        Zero second gaps count as 0 in the average, gaps next to a NULL timestamp are treated the same.
 
         Args:
-            tags (list): List of tags, each with a created_at attribute.
+            tags (TagTable): tags of the assignments
 
         Returns:
-            dict: Dictionary with tag IDs as keys and interval log values as values.
+            dict: {assignment_id: {user_id: (average interval log, number of tags)}}, users in the order of their first tag,
+                  a user with a single tag getting (-1, 1)
         """
-        interval_logs = {}
-        sorted_tags = sorted(tags, key=lambda tag: tag.created_at)
+        if not len(tags):
+            return {}
+        order, new_user, _, logs = _intervalGaps(tags)
+        assignment_ids, user_ids = tags.assignment_id[order], tags.user_id[order]
+        starts = np.flatnonzero(new_user)
+        counts = np.diff(np.append(starts, len(order)))
 
-        for i in range(1, len(sorted_tags)):
-            current_tag = sorted_tags[i]
-            previous_tag = sorted_tags[i-1]
-            time_diff = (current_tag.created_at - previous_tag.created_at).total_seconds()
+        # bincount adds the logs of a user one after another, in the order of the tags
+        sums = np.bincount(np.cumsum(new_user)[1:] - 1, weights=logs, minlength=len(starts))
+        averages = np.where(counts > 1, sums / np.maximum(counts - 1, 1), -1)
 
-            # Avoid negative or zero time differences
-            if time_diff <= 0:
-                continue
+        results = {}
+        for user in np.argsort(np.minimum.reduceat(order, starts), kind="stable").tolist():
+            start = starts[user]
+            results.setdefault(assignment_ids[start].item(), {})[user_ids[start].item()] = (averages[user].item() if counts[user] > 1 else -1, counts[user].item())
+        return results
 
-            # Calculate the interval log value
-            il_value = math.log(time_diff, 2)
-            interval_logs[current_tag.id] = il_value
+    def computeKrippendorffAlpha(self, data, users) -> dict:
+        """
+        Nominal Krippendorff alpha of every rater of a single team against the mode of the other raters (expected rater),
+        the same kernel computeKrippendorffAlphas runs for all teams together
 
-        return interval_logs
+        Args:
+            data (array): 2d array where columns represent raters and rows represent items, nan where a rater did not tag an item
+            users (list): user id of every column
 
+        Returns:
+            dict: {user_id: alpha} of the team
+        """
+        data = np.asarray(data, dtype=np.float64)
+        items, raters = np.nonzero(~np.isnan(data))
+        alphas = _nominalAlphas(items, raters, data[items, raters], np.zeros(data.shape[0], dtype=np.int64), np.zeros(data.shape[1], dtype=np.int64))
+        return dict(zip(users, alphas))
 
-    def computeKrippendorffAlpha(self, data, users) -> list:
+    def computeKrippendorffAlphas(self, matrix) -> list:
         """
-        Krippendorff alpha algorithm implementation using krippendorff library
-        
+        Krippendorff alpha of every rater of every team of a rater matrix, computed for all teams together
+
         Args:
-            data (array): 2d array where columns represent raters and rows represents tag_promot_ids
-        
+            matrix (RaterMatrix): item x rater matrix of the teams
+
         Returns:
-            list: list of alpha values of all users
+            list: {user_id: alpha} of every team, in the order of the teams of the matrix
         """
-        num_raters = len(users)
-        alphas = {}
-        for i in range(num_raters):
-            rater_data = data[:, i].astype(np.float64)  # Convert to float to ensure numeric types
-            other_data = np.delete(data, i, axis=1).astype(np.float64)
-            expected_data = []
-            for tags in other_data:
-                numeric_tags = tags[~np.isnan(tags)]
-                if numeric_tags.size > 0:
-                    mode_result = st.mode(numeric_tags)
-                    mode_value = mode_result.mode if mode_result.mode.size > 0 else np.nan
-                    expected_data.append(mode_value)
-                else:
-                    expected_data.append(np.nan)
-                
-            expected_data = np.array(expected_data)
-            
-            # Skip calculation if there's not enough variation
-            if np.nanstd(expected_data) == 0:
-                alphas[users[i]] = np.nan
-                continue
-            
-            try:
-                alpha = krippendorff.alpha(np.array([rater_data, expected_data]), level_of_measurement='nominal')
-                alphas[users[i]] = alpha
-            except ValueError:
-                # Handle the case where there's not enough variation to compute alpha
-                alphas[users[i]] = 'not enough variation'
-                
-        return alphas
+        team_items = np.repeat(np.arange(len(matrix)), np.diff(matrix.item_offsets))
+        team_raters = np.repeat(np.arange(len(matrix)), np.diff(matrix.rater_offsets))
+        entry_teams = np.repeat(np.arange(len(matrix)), np.diff(matrix.offsets))
+        valid = matrix.values != TagTable.MISSING
+        alphas = _nominalAlphas(matrix.item_offsets[entry_teams][valid] + matrix.items[valid], matrix.rater_offsets[entry_teams][valid] + matrix.raters[valid],
+                                matrix.values[valid], team_items, team_raters)
+        return [dict(zip(matrix.users(team).tolist(), alphas[matrix.rater_offsets[team]:matrix.rater_offsets[team + 1]])) for team in range(len(matrix))]
     
     def calculate_tag_credibility_score(self, user_history):
         """
         Calculates the credibility score for each tag in user_history based on fast tagging log values and Krippendorff's alpha.
 
         Args:
-            user_history (list): List of tag history items, each with attributes such as created_at, user_id, and tag values.
+            user_history (list or TagTable): List of tag history items, each with attributes such as created_at, user_id, and tag values,
+                                             or the tags table of the history.
 
         Returns:
             dict: A dictionary with tag IDs as keys and credibility scores as values.
         """
-        # Extract tags and users from user_history
-        tags = user_history
-        users = list(set(tag.user_id for tag in user_history))
+        tags = user_history if isinstance(user_history, TagTable) else TagTable.fromRows(
+            [tuple(getattr(tag, column) for column in TagTable.COLUMNS) for tag in user_history])
+        if not len(tags):
+            return {}
 
-        # Prepare data for Krippendorff's alpha calculation
-        # Assuming that each row in data represents a tag and each column represents a user's rating for that tag
-        tag_ids = [tag.id for tag in user_history]
-        data = np.full((len(tag_ids), len(users)), np.nan)
-        for i, tag in enumerate(user_history):
-            user_index = users.index(tag.user_id)
-            data[i, user_index] = tag.value  # Assuming 'value' is the rating given by the user for the tag
+        # Interval log of the gap before every tag, within the tags of its user
+        order, _, valid, logs = _intervalGaps(tags)
+        has_interval_log = np.zeros(len(tags), dtype=bool)
+        has_interval_log[order[1:][valid]] = True
+        il_values = np.zeros(len(tags))
+        il_values[order[1:][valid]] = logs[valid]
 
-        credibility_scores = {}
+        # Krippendorff's alpha of the user of every tag, non-numeric alphas count as 0
+        alphas, raters = self._userAlphas(tags)
+        alpha_values = np.array([alpha if isinstance(alpha, float) and not np.isnan(alpha) else 0 for alpha in alphas])[raters]
 
-        # Calculate interval logs for each tag
-        interval_logs = self.intervalLogsForTags(tags)
+        # Normalize values (assuming il_value and alpha_value are already in a suitable range)
+        max_il_value = il_values[has_interval_log].max() if has_interval_log.any() else 1
+        normalized_il = il_values / max_il_value if max_il_value > 0 else np.zeros(len(tags))
+        normalized_alpha = (alpha_values + 1) / 2          # alpha values are between -1 and 1
 
-        # Calculate Krippendorff's alpha for each tag
-        alphas = self.computeKrippendorffAlpha(data, users)
+        # Calculate credibility score for each tag
+        credibility_scores = (normalized_il + normalized_alpha) / 2
+        return {tag_id: round(credibility_score, 5) for tag_id, credibility_score in zip(tags.id.tolist(), credibility_scores.tolist())}
 
+    def _userAlphas(self, tags) -> tuple:
+        """
+        Krippendorff alpha of every user within its assignment, the items being the (answer, tag prompt) pairs the users of the
+        assignment tagged. Only tags with a value are rated, and a user tagging an item twice keeps the last tag.
 
-        # Normalize values (assuming il_value and alpha_value are already in a suitable range)
-        max_il_value = max(interval_logs.values(), default=1)
-        max_alpha_value = 1  # Assuming alpha values are between 0 and 1
+        Args:
+            tags (TagTable): tags of the assignments
 
-        # Calculate credibility score for each tag
-        for tag in tags:
-            tag_id = tag.id
-            il_value = interval_logs[tag_id] if tag_id in interval_logs else 0
-            alpha_value = alphas[tag_id] if tag_id in alphas else 0
+        Returns:
+            tuple: alpha of every user, and the user of every tag as an index into them
+        """
+        assignments = _codes(tags.assignment_id)
+        raters = _codes(tags.assignment_id, tags.user_id)
+        items = _codes(tags.assignment_id, tags.answer_id, tags.tag_prompt_id)
+        rater_groups = np.zeros(raters.max() + 1, dtype=np.int64)
+        rater_groups[raters] = assignments
+        item_groups = np.zeros(items.max() + 1, dtype=np.int64)
+        item_groups[items] = assignments
+
+        # Last rated tag of every (user, item)
+        rated = np.flatnonzero(tags.value != TagTable.MISSING)
+        rated = rated[np.lexsort((rated, items[rated], raters[rated]))]
+        last = np.ones(len(rated), dtype=bool)
+        last[:-1] = (raters[rated][1:] != raters[rated][:-1]) | (items[rated][1:] != items[rated][:-1])
+        rated = rated[last]
+
+        return _nominalAlphas(items[rated], raters[rated], tags.value[rated], item_groups, rater_groups), raters
+
+
+def _codes(*keys) -> np.ndarray:
+    """
+    Numbers the distinct combinations of the key columns, in sorted order
+    """
+    order = np.lexsort(keys[::-1])
+    new_code = np.zeros(len(order), dtype=bool)
+    new_code[:1] = True
+    for key in keys:
+        sorted_key = key[order]
+        new_code[1:] |= sorted_key[1:] != sorted_key[:-1]
+    codes = np.empty(len(order), dtype=np.int64)
+    codes[order] = np.cumsum(new_code) - 1
+    return codes
+
+
+def _intervalGaps(tags) -> tuple:
+    """
+    Sorts the tags by (assignment_id, user_id, created_at) and takes the log base 2 of the gaps between subsequent tags of a user
+
+    Returns:
+        tuple: sort order of the tags, whether every sorted tag is the first of its user, whether the gap before every
+               sorted tag but the first is kept (it follows a tag of the same user, both timestamps are known and it is
+               longer than zero) and the log of every gap, 0 where it is not kept
+    """
+    order = np.lexsort((tags.created_at, tags.user_id, tags.assignment_id))
+    assignment_ids, user_ids, created_at = tags.assignment_id[order], tags.user_id[order], tags.created_at[order]
+    new_user = np.ones(len(order), dtype=bool)
+    new_user[1:] = (assignment_ids[1:] != assignment_ids[:-1]) | (user_ids[1:] != user_ids[:-1])
+
+    gaps = np.diff(created_at) / 1e6
+    known = created_at != TagTable.NULL_TIME
+    valid = ~new_user[1:] & known[1:] & known[:-1] & (gaps > 0)
+    logs = np.zeros(len(gaps))
+    logs[valid] = np.log2(gaps[valid])
+    return order, new_user, valid, logs
+
+
+def _nominalAlphas(items, raters, values, item_groups, rater_groups) -> list:
+    """
+    Nominal Krippendorff alpha of every rater against an expected rater holding, for every item of the rater's group,
+    the mode of the values the other raters of the group gave it (the smallest value on ties). Matches running
+    krippendorff.alpha on the two rows, with the same special cases:
+    nan when the expected values are all equal, and 'not enough variation' when the two rows hold at most one distinct
+    value or no item rated by both.
+
+    The value counts of every item are built once. The expected value of an item the rater did not rate is the mode of
+    its counts, and of an item the rater did rate the mode of its counts less the rater's own value, so only the
+    histograms of those modes are needed per rater. With two coders the coincidences reduce to
+    alpha = 1 - 2 D / sum(n_u n_v / (n - 1) for u != v), D being the number of items the coders disagree on,
+    n the number of pairable values and n_v the number of them equal to v.
+
+    Args:
+        items (array): item of every rated entry, numbered across all groups
+        raters (array): rater of every rated entry, numbered across all groups
+        values (array): value of every rated entry
+        item_groups (array): group of every item
+        rater_groups (array): group of every rater
+
+    Returns:
+        list: alpha of every rater, nan or 'not enough variation' in the special cases
+    """
+    num_raters = len(rater_groups)
+    domain, codes = np.unique(values, return_inverse=True)
+    num_values = max(len(domain), 1)
+    entries = np.arange(len(items))
+
+    def histogram(rows, columns, num_rows=num_raters):
+        counts = np.zeros((num_rows, num_values), dtype=np.int64)
+        np.add.at(counts, (rows, columns), 1)
+        return counts
+
+    # Value counts of every item, and the mode of every item with a value
+    counts = histogram(items, codes, len(item_groups))
+    has_mode = counts.any(axis=1)
+    modes = counts.argmax(axis=1)
+    group_modes = histogram(item_groups[has_mode], modes[has_mode], int(max(item_groups.max(initial=-1), rater_groups.max(initial=-1))) + 1)
+
+    # Leave-one-out mode of every rated entry, absent when the rater is the only one who rated the item
+    other_counts = counts[items]
+    other_counts[entries, codes] -= 1
+    pairable = other_counts.any(axis=1)
+    expected = other_counts.argmax(axis=1)
 
-            normalized_il = il_value / max_il_value if max_il_value > 0 else 0
-            normalized_alpha = (alpha_value+1) / 2 if max_alpha_value > 0 else 0
+    # Histograms of the expected row of every rater: modes of the items it did not rate and leave-one-out modes of the items it did
+    unrated_modes = group_modes[rater_groups] - histogram(raters, modes[items])
+    rated_modes = histogram(raters[pairable], expected[pairable])
+    expected_values = (unrated_modes + rated_modes) > 0
+    domain_size = (expected_values | (histogram(raters, codes) > 0)).sum(axis=1)
 
-            # Calculate credibility score
-            credibility_score = (normalized_il + normalized_alpha) / 2
-            credibility_scores[tag_id] = round(credibility_score, 5)
+    # Coincidences of the pairable items
+    num_pairs = np.bincount(raters[pairable], minlength=num_raters)
+    value_counts = rated_modes + histogram(raters[pairable], codes[pairable])
+    disagreements = np.bincount(raters[pairable], weights=codes[pairable] != expected[pairable], minlength=num_raters)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        random_coincidences = value_counts[:, :, None] * value_counts[:, None, :] / (2 * num_pairs - 1)[:, None, None].astype(np.float64)
+        random_coincidences[:, np.arange(num_values), np.arange(num_values)] = 0
+        alphas = 1 - 2 * disagreements / random_coincidences.reshape(num_raters, -1).sum(axis=1)
 
-        return credibility_scores
+    results = []
+    for alpha, num_expected, size, pairs in zip(alphas.tolist(), expected_values.sum(axis=1).tolist(), domain_size.tolist(), num_pairs.tolist()):
+        if num_expected == 1:
+            results.append(np.nan)                      # all expected values are the same, no variation to compare to
+        elif size <= 1 or pairs == 0:
+            results.append('not enough variation')
+        else:
+            results.append(alpha)
+    return results
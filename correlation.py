@@ -1,62 +1,72 @@
-import pandas as pd
+import argparse
+import hashlib
 import os
-from MySQL import MySQL
-from collections import defaultdict
 import numpy as np
+import pandas as pd
+from Models.TagTable import TagTable
+from MySQL import MySQL, BATCH_SIZE
+from SQLiteDataSource import SQLiteDataSource
 
+QUADRANT_EDGES = [2, 4, 6, 8]           # upper bounds of the score quadrants 1, 3, 5 and 7, anything above is quadrant 9
+QUADRANTS = [1, 3, 5, 7]
 
-class Correlation:
-
-    def __init__(self) -> None:
-        #self._connector = MySQL()                       # MySQL connector to call methods of MySQL class
-        self.assignment_to_user = defaultdict(dict)
-        #self.getUserTags()
-
-        self.manual_grades = pd.read_excel("Manual_grades.xlsx")
-        
-        self.interval_logs_result = pd.read_csv("Interval_logs.csv")
-
-        self.krippendorf_alpha_result = pd.read_csv("krippendorff.csv")
-
-        self.agreement_disagreement_result = pd.read_csv("tags.csv")
-
-        self.pattern_detection_result = pd.read_csv("Pattern_recognition.txt", sep='/')
-
-    def __getUserTags(self):
-        tags = self._connector.getAnswerTags()
-        self.records = pd.DataFrame(columns=["Assignment_id", "User_id", "Answer_id", "Tag_prompt_id", "Value"])
-        count = 0
-        for tag in tags:
-            data = {"Assignment_id": tag.assignment_id, "User_id": tag.user_id, "Answer_id": tag.answer_id, "Tag_prompt_id": tag.tag_prompt_id, "Value":tag.value}
-            data = pd.DataFrame(data, index=[count])
-            self.records = pd.concat([self.records, data])
-            print(count)
-            count+=1
-
-        f=open("trial.csv", "w")
-        f.write("Assignment_id,User_id,Answer_id,Tag_prompt_id,Value\n")
-        for index, row in self.records.iterrows():
-            f.write(str(row["Assignment_id"])+ "," + str(row["User_id"])+ "," + str(row["Answer_id"])+ "," + str(row["Tag_prompt_id"])+ "," + str(row["Value"])+ "\n")
-        f.close()
 
+class Correlation:
+    """
+    Correlates the results of the pipeline of an assignment (interval logs, Krippendorff's alpha, agreement of the
+    tags and pattern detection) with the manual grades of the users, bucketing both into score quadrants.
+    """
+    def __init__(self, manual_grades="Manual_grades.xlsx", interval_logs="Interval_logs.csv", krippendorff="krippendorff.csv",
+                 tags="tags.csv", patterns="Pattern_recognition.txt", user_tags="trial.csv", cache_dir=os.path.join("data", "cache")) -> None:
+        self.user_tags_path = user_tags                 # CSV of the tags of every user, as written by getUserTags
+
+        self.manual_grades = loadManualGrades(manual_grades, cache_dir)
+
+        self.interval_logs_result = pd.read_csv(interval_logs)
+
+        self.krippendorf_alpha_result = pd.read_csv(krippendorff)
+
+        # Agreement table as written by TagClassifier.agreementTable, keyed like the user tags
+        self.agreement_disagreement_result = pd.read_csv(tags).rename(columns={"answer_id": "Answer_id", "tag_prompt_id": "Tag_prompt_id"})
+
+        self.pattern_detection_result = pd.read_csv(patterns, sep='/')
+
+    def getUserTags(self, connector, batch_size=BATCH_SIZE) -> pd.DataFrame:
+        """
+        Fetches the tags of every user of the assignments of the connector in one stream of tag rows and writes them to the user tags file
+        Args:
+            connector (DataSource): data source of the assignments
+            batch_size (int): number of tag rows fetched per round-trip
+        Returns:
+            DataFrame: Assignment_id, User_id, Answer_id, Tag_prompt_id and Value of every tag
+        """
+        tags = TagTable.concat([TagTable.fromRows(rows) for rows in connector.iterTagRows(batch_size)])
+        records = pd.DataFrame({
+            "Assignment_id": tags.assignment_id,
+            "User_id": tags.user_id,
+            "Answer_id": tags.answer_id,
+            "Tag_prompt_id": tags.tag_prompt_id,
+            "Value": pd.Series(tags.value, dtype="Int8").mask(tags.value == TagTable.MISSING),
+        })
+        records.to_csv(self.user_tags_path, index=False)
+        print(f"{len(records)} user tags written to {self.user_tags_path}")
+        return records
 
     def sortManualGrades(self):
         self.manual_grades = self.manual_grades.sort_values('Assignment Id', ascending=False)
 
     def modifyIntervalLogsResults(self):
-        self.interval_logs_result["IL_result"] = self.interval_logs_result["IL_result"].apply(lambda x: 1 if float(x)>=1.0 else -1)
+        self.interval_logs_result["IL_result"] = np.where(self.interval_logs_result["IL_result"].astype(float) >= 1.0, 1, -1)
         print(self.interval_logs_result)
-    
-    def __generateAgreementDisagreemtScore(self, observed_value, computed_value, fraction):
-        #fraction = fraction.trim()
-        #print(observed_value, computed_value, fraction)
-        if float(fraction) < 0.5:
-            return float(fraction)
-        else:
-            if float(computed_value) == float(observed_value):
-                return float(fraction)
-            else:
-                return 1 - float(fraction)
+
+    def __generateAgreementDisagreemtScore(self, observed_values, computed_values, fractions) -> np.ndarray:
+        """
+        Scores every tag by the agreement of the observed value with the major value of its item: the fraction of the
+        raters giving the major value when it is below 0.5 or the tag agrees with it, one minus the fraction otherwise
+        """
+        fractions = fractions.astype(float).to_numpy()
+        agrees = observed_values.astype(float).to_numpy() == computed_values.astype(float).to_numpy()
+        return np.where((fractions < 0.5) | agrees, fractions, 1 - fractions)
 
     def convertToInt(self, x):
         if (x):
@@ -64,68 +74,106 @@ class Correlation:
         else:
             return int(x)
 
-    def computeFinalScore(self, x):
-        il_result = x[2]
-        agreement_disagreement = x[3]
-        krippenddorff_alpha = x[5]
-        pattern = x[8]
-        #print(pattern)
-
-        if il_result=='nan':
-            il_result=-1
-        if agreement_disagreement=='nan':
-            agreement_disagreement=-1
-        if krippenddorff_alpha=='nan':
-            krippenddorff_alpha=-1
-        if pattern=='nan':
-            pattern=-1
-        res =  float(il_result) + float(agreement_disagreement) + float(krippenddorff_alpha) + float(pattern)
-        return ((res+4)/8)*10
-
-    def convertToQuadrant(self, x):
-        if x<2:
-            return 1
-        elif 2<=x<4:
-            return 3
-        elif 4<=x<6:
-            return 5
-        elif 6<=x<8:
-            return 7
-        else:
-            return 9
-
-    def modifyAgreementDisagreemt(self):
-        #self.__getUserTags()
-        #print("User tags recorded..........")
+    def computeFinalScore(self, results) -> pd.Series:
+        """
+        Sums the interval logs, agreement, Krippendorff's alpha and pattern detection results of every row, missing
+        results counting as -1, and scales the sum from [-4, 4] to [0, 10]
+        """
+        columns = ["IL_result", "Agreement_Disagreement_Score", "Alphas", "PD_result"]
+        res = results[columns].apply(pd.to_numeric, errors="coerce").fillna(-1).sum(axis=1)
+        return ((res + 4) / 8) * 10
+
+    def convertToQuadrant(self, x) -> np.ndarray:
+        """
+        Buckets scores into the quadrants 1 (below 2), 3, 5, 7 and 9 (8 and above, or missing)
+        """
+        x = pd.to_numeric(pd.Series(x), errors="coerce").to_numpy(dtype=float)
+        return np.select([x < edge for edge in QUADRANT_EDGES], QUADRANTS, 9)
+
+    def modifyAgreementDisagreemt(self, output="final_result.csv"):
         self.modifyIntervalLogsResults()
-        self.records = pd.read_csv("trial.csv")
+        self.records = pd.read_csv(self.user_tags_path)
         self.records = pd.merge(self.records, self.agreement_disagreement_result, on=['Assignment_id', 'Answer_id', 'Tag_prompt_id'])
         self.interval_logs_result['User_id'] = self.interval_logs_result['User_id'].astype(pd.Int64Dtype())
 
-        self.interval_logs_result["Agreement_Disagreement_Score"] = self.records.apply(lambda x: self.__generateAgreementDisagreemtScore(x[4], x[6], x[7]), axis=1)
+        # Scores are assigned by row label, as the per-row apply did
+        self.interval_logs_result["Agreement_Disagreement_Score"] = pd.Series(
+            self.__generateAgreementDisagreemtScore(self.records["Value"], self.records["value"], self.records["fraction"]), index=self.records.index)
 
         self.interval_logs_result = pd.merge(self.interval_logs_result, self.krippendorf_alpha_result, on=['Assignment_id', 'User_id'], how='left')
 
         self.interval_logs_result = pd.merge(self.interval_logs_result, self.manual_grades, on=['Assignment_id', 'User_id'])
-        
+
         self.pattern_detection_result['User_id'] = self.pattern_detection_result['User_id'].astype(pd.Int64Dtype())
 
         self.interval_logs_result = pd.merge(self.interval_logs_result, self.pattern_detection_result, on=['Assignment_id', 'User_id'])
-        
-        self.interval_logs_result['PD_result'] = self.interval_logs_result['PD_result'].apply(lambda x: -1 if x=="Found" else 1)
-        
-        self.interval_logs_result['Final_score'] = self.interval_logs_result.apply(lambda x: self.computeFinalScore(x), axis=1)
+
+        self.interval_logs_result['PD_result'] = np.where(self.interval_logs_result['PD_result'] == "Found", -1, 1)
+
+        self.interval_logs_result['Final_score'] = self.computeFinalScore(self.interval_logs_result)
         columns_to_delete = ['Team_id', 'Comments', 'Pattern', 'Repetition']
-        self.interval_logs_result = self.interval_logs_result.drop(columns=columns_to_delete, axis=1)
-        
-        self.interval_logs_result["Grades"] = self.interval_logs_result["Grades"].apply(lambda x: self.convertToQuadrant(x))
-        self.interval_logs_result["Final_score"] = self.interval_logs_result["Final_score"].apply(lambda x: self.convertToQuadrant(x))
+        self.interval_logs_result = self.interval_logs_result.drop(columns=columns_to_delete, axis=1, errors='ignore')
 
+        self.interval_logs_result["Grades"] = self.convertToQuadrant(self.interval_logs_result["Grades"])
+        self.interval_logs_result["Final_score"] = self.convertToQuadrant(self.interval_logs_result["Final_score"])
 
-        self.interval_logs_result.to_csv("final_result.csv", index=False)
+        self.interval_logs_result.to_csv(output, index=False)
 
         confusion_matrix = pd.crosstab(self.interval_logs_result['Grades'], self.interval_logs_result['Final_score'])
 
         print(confusion_matrix)
-corr = Correlation()
-corr.modifyAgreementDisagreemt()
\ No newline at end of file
+        return confusion_matrix
+
+
+def loadManualGrades(path, cache_dir) -> pd.DataFrame:
+    """
+    Reads the manual grades spreadsheet through a Parquet copy in the cache directory, parsed again only when the
+    spreadsheet is newer than its copy. Copies are keyed by the absolute path of the spreadsheet, so spreadsheets of
+    the same name in different directories do not share one
+    Args:
+        path (str): path of the manual grades spreadsheet
+        cache_dir (str): directory the parsed copy is kept in
+    Returns:
+        DataFrame: the manual grades
+    """
+    key = hashlib.sha256(os.path.abspath(path).encode()).hexdigest()[:20]
+    cache_path = os.path.join(cache_dir, f"{os.path.splitext(os.path.basename(path))[0]}_{key}.parquet")
+    if os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(path):
+        return pd.read_parquet(cache_path)
+
+    manual_grades = pd.read_excel(path)
+    os.makedirs(cache_dir, exist_ok=True)
+    manual_grades.to_parquet(cache_path + ".tmp", index=False)
+    os.replace(cache_path + ".tmp", cache_path)
+    print(f"Manual grades cached in {cache_path}")
+    return manual_grades
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Correlate the results of an assignment with its manual grades.")
+    parser.add_argument('--manual_grades', type=str, default="Manual_grades.xlsx", help="Spreadsheet of the manual grades.")
+    parser.add_argument('--interval_logs', type=str, default="Interval_logs.csv", help="Interval logs results.")
+    parser.add_argument('--krippendorff', type=str, default="krippendorff.csv", help="Krippendorff's alpha results.")
+    parser.add_argument('--tags', type=str, default="tags.csv", help="Agreement/Disagreement table of the tags.")
+    parser.add_argument('--patterns', type=str, default="Pattern_recognition.txt", help="Pattern detection results.")
+    parser.add_argument('--user_tags', type=str, default="trial.csv", help="Tags of every user, written by --fetch_tags.")
+    parser.add_argument('--output', type=str, default="final_result.csv", help="File the correlated results are written to.")
+    parser.add_argument('--cache_dir', type=str, default=os.path.join("data", "cache"), help="Directory of the parsed manual grades.")
+    parser.add_argument('--fetch_tags', action='store_true', help="Fetch the user tags from the database before correlating.")
+    parser.add_argument('--assignments', type=int, nargs='+', default=[1166], help="Assignment ids the user tags are fetched for.")
+    parser.add_argument('--database', type=str, default=None, help="Offline SQLite database used instead of MySQL.")
+    parser.add_argument('--batch_size', type=int, default=BATCH_SIZE, help="Number of rows streamed from the database per batch.")
+    args = parser.parse_args(argv)
+
+    corr = Correlation(args.manual_grades, args.interval_logs, args.krippendorff, args.tags, args.patterns, args.user_tags, args.cache_dir)
+    if args.fetch_tags:
+        connector = MySQL(args.assignments, pool_size=1) if args.database is None else SQLiteDataSource(args.database, args.assignments, pool_size=1)
+        try:
+            corr.getUserTags(connector, args.batch_size)
+        finally:
+            connector.close()
+    corr.modifyAgreementDisagreemt(args.output)
+
+
+if __name__ == "__main__":
+    main()
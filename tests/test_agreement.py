@@ -0,0 +1,59 @@
+from collections import Counter
+from datetime import datetime
+import numpy as np
+from Models.RaterMatrix import RaterMatrix
+from Models.TagTable import TagTable, decodeValues
+from TagClassifier import TagClassifier
+
+_UNRATED = object()     # grid cell of a rater who did not tag the item
+
+
+def _randomTags(rng) -> tuple:
+    """
+    Tag rows of small teams, so that items often have ties between their values, with missing values and items tagged twice
+    """
+    team_members, rows = [], []
+    for team_id in range(rng.integers(1, 8)):
+        users = (team_id * 10 + np.arange(rng.integers(1, 6))).tolist()
+        team_members.extend((1, user_id, team_id) for user_id in users)
+        for _ in range(rng.integers(1, 30)):
+            rows.append((len(rows) + 1, 1, team_id * 10 + int(rng.integers(0, 4)), 1, int(rng.choice(users)),
+                         rng.choice(["1", "-1", "0", None], p=[0.4, 0.4, 0.1, 0.1]), datetime(2024, 1, 1), None, int(rng.integers(0, 2))))
+    rng.shuffle(rows)
+    return TagTable.fromRows(rows), team_members
+
+
+def _referenceAgreement(data) -> list:
+    """
+    Major value and fraction of every item of a team, as the per-team loop over its item x rater grid of tags did
+    """
+    results = []
+    for i in range(data.shape[0]):
+        row = [data[i, j] for j in range(data.shape[1]) if data[i, j] is not _UNRATED]
+        value, frequency = Counter(row).most_common(1)[0]
+        results.append((value, frequency / data.shape[1]))
+    return results
+
+
+def test_agreement_table_matches_per_team_loop():
+    classifier = TagClassifier()
+    rng = np.random.default_rng(14)
+    mismatches = 0
+    for _ in range(1000):
+        matrix = RaterMatrix.build(*_randomTags(rng))
+        table = classifier.agreementTable(matrix)
+
+        expected = []
+        for team in range(len(matrix)):
+            items, raters, values, _ = matrix.entries(team)
+            data = np.full(matrix.shape(team), _UNRATED, dtype=object)
+            data[items, raters] = decodeValues(values)
+            item_ids = slice(matrix.item_offsets[team], matrix.item_offsets[team + 1])
+            for answer_id, tag_prompt_id, (value, fraction) in zip(matrix.item_answer_ids[item_ids].tolist(), matrix.item_prompt_ids[item_ids].tolist(),
+                                                                   _referenceAgreement(data)):
+                expected.append((matrix.assignment_ids[team].item(), matrix.team_ids[team].item(), answer_id, tag_prompt_id, value, fraction))
+
+        rows = list(table.itertuples(index=False, name=None))
+        mismatches += len(rows) != len(expected)
+        mismatches += sum(row[:5] != reference[:5] or not np.isclose(row[5], reference[5]) for row, reference in zip(rows, expected))
+    assert mismatches == 0
@@ -0,0 +1,40 @@
+from datetime import datetime, timedelta
+import numpy as np
+from Models.TagTable import TagTable
+from TaggerClassifier import TaggerClassifier
+
+
+def _randomTags(rng) -> TagTable:
+    """
+    Tag rows of a few assignments and users in random order, many of them created in the same second or microsecond
+    """
+    rows = []
+    for _ in range(rng.integers(1, 120)):
+        created_at = datetime(2024, 1, 1) + timedelta(seconds=int(rng.integers(0, 12)) * int(rng.choice([1, 60, 3600])),
+                                                      microseconds=int(rng.integers(0, 10 ** 6)) if rng.random() < 0.2 else 0)
+        rows.append((len(rows) + 1, int(rng.integers(1, 3)), int(rng.integers(0, 20)), 1, int(rng.integers(0, 8)),
+                     rng.choice(["1", "-1", "0"]), created_at, created_at, 1))
+    rng.shuffle(rows)
+    return TagTable.fromRows(rows)
+
+
+def test_interval_logs_match_build_interval_logs():
+    classifier = TaggerClassifier()
+    rng = np.random.default_rng(11)
+    mismatches = 0
+    for _ in range(1000):
+        tags = _randomTags(rng)
+        results = classifier.computeIntervalLogs(tags)
+
+        # Tags of every user as records, assignments and users in the order of their first tag
+        expected = {}
+        for row in range(len(tags)):
+            expected.setdefault(tags.assignment_id[row].item(), {}).setdefault(tags.user_id[row].item(), []).append(tags[row])
+        mismatches += list(results) != list(expected)
+        for assignment_id, users in expected.items():
+            mismatches += list(results.get(assignment_id, {})) != list(users)
+            for user_id, user_tags in users.items():
+                average, count = results[assignment_id][user_id]
+                expected_average, expected_count = classifier.buildIntervalLogs(user_tags)
+                mismatches += count != expected_count or not np.isclose(average, expected_average)
+    assert mismatches == 0
@@ -0,0 +1,87 @@
+from collections import Counter
+import numpy as np
+from Models.RaterMatrix import RaterMatrix
+from Models.TagTable import TagTable
+from TaggerClassifier import TaggerClassifier
+
+
+def _referenceAlpha(data, rater):
+    """
+    Nominal Krippendorff alpha of a rater against the mode of the other raters, computed directly from the
+    coincidence matrix of the two rows, with the special cases of the krippendorff library based implementation
+    """
+    rater_values = data[:, rater]
+    expected = []
+    for item in np.delete(data, rater, axis=1):
+        counts = Counter(item[~np.isnan(item)].tolist())
+        expected.append(min(value for value, count in counts.items() if count == max(counts.values())) if counts else np.nan)
+    expected = np.array(expected)
+
+    known = expected[~np.isnan(expected)]
+    if len(known) and np.all(known == known[0]):
+        return np.nan
+    rows = np.array([rater_values, expected])
+    domain = np.unique(rows[~np.isnan(rows)])
+    pairable = ~np.isnan(rater_values) & ~np.isnan(expected)
+    if len(domain) <= 1 or not pairable.any():
+        return 'not enough variation'
+
+    # Every item rated by both rows adds its pair of values to the coincidence matrix in both orders
+    index = {value: code for code, value in enumerate(domain.tolist())}
+    coincidences = np.zeros((len(domain), len(domain)))
+    for first, second in zip(rater_values[pairable].tolist(), expected[pairable].tolist()):
+        coincidences[index[first], index[second]] += 1
+        coincidences[index[second], index[first]] += 1
+    totals = coincidences.sum(axis=1)
+    n = totals.sum()
+    different = 1 - np.eye(len(domain))
+    observed = (coincidences * different).sum()
+    chance = (np.outer(totals, totals) * different).sum() / (n - 1)
+    with np.errstate(invalid="ignore"):
+        return 1 - np.float64(observed) / chance       # nan when the pairable values all agree
+
+
+def _same(alpha, reference) -> bool:
+    if isinstance(reference, str) or isinstance(alpha, str):
+        return alpha == reference
+    if np.isnan(reference):
+        return np.isnan(alpha)
+    return np.isclose(alpha, reference)
+
+
+def _randomTags(rng, num_teams) -> tuple:
+    """
+    Tags of a few teams of an assignment, the members of a team tagging the same answers and prompts, with missing
+    values and items tagged twice
+    """
+    columns = {column: [] for column in TagTable.COLUMNS}
+    team_members = []
+    for team in range(num_teams):
+        users = (team * 100 + np.arange(rng.integers(1, 7))).tolist()
+        team_members.extend((1, user, team) for user in users)
+        for _ in range(rng.integers(1, 40)):
+            columns["user_id"].append(rng.choice(users))
+            columns["answer_id"].append(team * 100 + rng.integers(0, 8))
+            columns["tag_prompt_id"].append(rng.integers(0, 2))
+            columns["value"].append(rng.choice([-1, 0, 1, TagTable.MISSING], p=[0.4, 0.1, 0.4, 0.1]))
+    num_tags = len(columns["user_id"])
+    columns.update(id=np.arange(num_tags), assignment_id=np.ones(num_tags), tag_prompt_deployment_id=columns["tag_prompt_id"],
+                   created_at=np.arange(num_tags), updated_at=np.arange(num_tags))
+    return TagTable({column: np.asarray(values, dtype=TagTable.DTYPES[column]) for column, values in columns.items()}), team_members
+
+
+def test_alphas_match_direct_computation():
+    classifier = TaggerClassifier()
+    rng = np.random.default_rng(12)
+    mismatches = 0
+    for _ in range(300):
+        # Several teams computed together from the rater matrix, and every team on its own from its dense matrix
+        matrix = RaterMatrix.build(*_randomTags(rng, 10))
+        team_alphas = classifier.computeKrippendorffAlphas(matrix)
+        for team in range(len(matrix)):
+            data, users = matrix.dense(team), matrix.users(team).tolist()
+            references = dict(zip(users, (_referenceAlpha(data, rater) for rater in range(len(users)))))
+            for alphas in (team_alphas[team], classifier.computeKrippendorffAlpha(data, users)):
+                mismatches += list(alphas) != users
+                mismatches += sum(not _same(alphas[user], references[user]) for user in users)
+    assert mismatches == 0
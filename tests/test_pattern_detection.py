@@ -0,0 +1,94 @@
+import numpy as np
+from PatternDetection_refactored import PatternDetection
+
+
+def _randomSequence(rng) -> list:
+    """
+    Random tag values, either noise or repeated motifs with a few values changed, so that patterns are found
+    """
+    values = np.array(["1", "-1", "0"])
+    if rng.random() < 0.3:
+        return values[rng.choice(3, size=rng.integers(0, 60), p=[0.45, 0.45, 0.1])].tolist()
+    sequence = []
+    for _ in range(rng.integers(1, 4)):
+        motif = values[rng.choice(3, size=rng.integers(1, 8), p=[0.45, 0.45, 0.1])]
+        sequence.extend(np.tile(motif, rng.integers(1, 12)).tolist())
+    for position in rng.choice(len(sequence), size=rng.integers(0, 4), replace=True):
+        sequence[position] = values[rng.integers(3)]
+    return sequence
+
+
+def _codes(sequence) -> np.ndarray:
+    labels = {}
+    return np.array([labels.setdefault(value, len(labels)) for value in sequence], dtype=np.int64)
+
+
+def test_periodic_patterns_match_periodicity_check():
+    detection = PatternDetection()
+    rng = np.random.default_rng(15)
+    mismatches = 0
+    for _ in range(6000):
+        sequence = _randomSequence(rng)
+        lmin = int(rng.integers(1, 6))
+        lmax = int(rng.integers(lmin, 25))
+        min_tags = int(rng.integers(1, 20))
+        expected = [pattern for period in range(lmin, lmax + 1) for pattern in detection.PeriodicityCheckAllPatterns(sequence, period, min_tags)]
+        mismatches += list(detection.PeriodicPatterns(_codes(sequence), sequence, lmin, lmax, min_tags)) != expected
+    assert mismatches == 0
+
+
+def test_sequence_patterns_match_periodicity_check():
+    detection = PatternDetection()
+    rng = np.random.default_rng(16)
+    mismatches = 0
+    for _ in range(2000):
+        sequence = _randomSequence(rng)
+        lmin = int(rng.integers(1, 6))
+        lmax = int(rng.integers(lmin, 25))
+        min_tags = int(rng.integers(1, 20))
+
+        # Patterns of every period, leaving out those whose values are a subset of a pattern found before
+        expected = []
+        for period in range(lmin, lmax + 1):
+            for pattern, count in detection.PeriodicityCheckAllPatterns(sequence, period, min_tags):
+                if not any(set(pattern).issubset(set(found)) for found, _ in expected):
+                    expected.append((pattern, count))
+        mismatches += detection.SequencePatterns(_codes(sequence), sequence, lmin, lmax, min_tags) != (expected or [("Not_found", 0)])
+    assert mismatches == 0
+
+
+def _referenceRuns(sequence) -> list:
+    """
+    (value, start, length) of every run of equal values of a sequence, walking it value by value
+    """
+    runs = []
+    for position, value in enumerate(sequence):
+        if runs and runs[-1][0] == value:
+            runs[-1][2] += 1
+        else:
+            runs.append([value, position, 1])
+    return [tuple(run) for run in runs]
+
+
+def test_run_lengths_match_sequence_walk():
+    detection = PatternDetection()
+    rng = np.random.default_rng(17)
+    mismatches = 0
+    for _ in range(2000):
+        # Sequences of Y (1), N (-1) and other values, some empty, laid one after another
+        sequences = [np.repeat(rng.choice([1, -1, 0], size=rng.integers(0, 12)), int(rng.integers(1, 15))) for _ in range(rng.integers(1, 8))]
+        for sequence in sequences:
+            rng.shuffle(sequence[:rng.integers(0, len(sequence) + 1)])
+        values = np.concatenate(sequences).astype(np.int8)
+        lengths = [len(sequence) for sequence in sequences]
+
+        runs = [(index, *run) for index, sequence in enumerate(sequences) for run in _referenceRuns(sequence.tolist())]
+        mismatches += list(zip(*(array.tolist() for array in detection.RunLengths(values, lengths)))) != runs
+
+        min_lengths = {1: int(rng.integers(1, 12)), -1: int(rng.integers(1, 12))}
+        long_runs = detection.LongRuns(values, lengths, min_lengths)
+        for value, min_length in min_lengths.items():
+            expected = [[length for run_value, _, length in _referenceRuns(sequence.tolist()) if run_value == value and length >= min_length]
+                        for sequence in sequences]
+            mismatches += long_runs[value] != expected
+    assert mismatches == 0
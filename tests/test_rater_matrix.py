@@ -0,0 +1,69 @@
+from datetime import datetime, timedelta
+import numpy as np
+from Models.RaterMatrix import RaterMatrix
+from Models.TagTable import TagTable
+
+
+def _randomTags(rng) -> tuple:
+    """
+    Tag rows of two assignments in random order, users tagging items of their teams several times, some users
+    being in two teams and some in none
+    """
+    team_members, rows = [], []
+    for assignment_id in (1, 2):
+        for user_id in range(rng.integers(1, 10)):
+            for team_id in rng.choice(4, size=rng.integers(0, 3), replace=False).tolist():
+                team_members.append((assignment_id, user_id, team_id))
+        for _ in range(rng.integers(0, 60)):
+            rows.append((len(rows) + 1, assignment_id, int(rng.integers(0, 6)), 1, int(rng.integers(0, 10)),
+                         rng.choice(["1", "-1", "0", None]), datetime(2024, 1, 1) + timedelta(seconds=len(rows)), None, int(rng.integers(0, 2))))
+    rng.shuffle(rows)
+    rng.shuffle(team_members)
+    return TagTable.fromRows(rows), team_members
+
+
+def _referenceTeams(tags, team_members) -> list:
+    """
+    Teams of the {assignment: {team: {user: {item: row}}}} hierarchy filled tag by tag, every tag going to the teams of
+    its user in membership order and a later tag of a user on an item replacing the earlier one
+    """
+    teams_of = {}
+    for assignment_id, user_id, team_id in team_members:
+        teams_of.setdefault((assignment_id, user_id), []).append(team_id)
+    hierarchy, team_items = {}, {}
+    for row in range(len(tags)):
+        assignment_id, user_id = tags.assignment_id[row].item(), tags.user_id[row].item()
+        item = (tags.answer_id[row].item(), tags.tag_prompt_id[row].item())
+        for team_id in teams_of.get((assignment_id, user_id), []):
+            hierarchy.setdefault(assignment_id, {}).setdefault(team_id, {}).setdefault(user_id, {})[item] = row
+            team_items.setdefault((assignment_id, team_id), {}).setdefault(item, len(team_items[(assignment_id, team_id)]))
+
+    teams = []
+    for assignment_id, assignment_teams in hierarchy.items():
+        for team_id, users in assignment_teams.items():
+            items = team_items[(assignment_id, team_id)]
+            entries = sorted((rater, items[item], row) for rater, user_items in enumerate(users.values()) for item, row in user_items.items())
+            teams.append((assignment_id, team_id, list(users), list(items), entries))
+    return teams
+
+
+def _matrixTeams(matrix) -> list:
+    teams = []
+    for team in range(len(matrix)):
+        items = slice(matrix.item_offsets[team], matrix.item_offsets[team + 1])
+        item_ids = list(zip(matrix.item_answer_ids[items].tolist(), matrix.item_prompt_ids[items].tolist()))
+        team_items, raters, _, rows = matrix.entries(team)
+        teams.append((matrix.assignment_ids[team].item(), matrix.team_ids[team].item(), matrix.users(team).tolist(), item_ids,
+                      list(zip(raters.tolist(), team_items.tolist(), rows.tolist()))))
+    return teams
+
+
+def test_rater_matrix_matches_team_hierarchy():
+    rng = np.random.default_rng(10)
+    mismatches = 0
+    for _ in range(1000):
+        tags, team_members = _randomTags(rng)
+        matrix = RaterMatrix.build(tags, team_members)
+        mismatches += _matrixTeams(matrix) != _referenceTeams(tags, team_members)
+        mismatches += not np.array_equal(matrix.values, tags.value[matrix.rows])
+    assert mismatches == 0